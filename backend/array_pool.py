@@ -0,0 +1,52 @@
+"""
+Pool of reusable numpy scratch buffers for request-scoped image processing
+"""
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Tuple
+import numpy as np
+
+class ArrayPool:
+    """
+    Thread-safe pool of numpy buffers keyed by (shape, dtype)
+    """
+
+    def __init__(self, max_per_key: int = 4, max_keys: int = 8):
+        self.max_per_key = max_per_key
+        self.max_keys = max_keys  # Upload sizes vary; only the most recent shapes are kept
+        self._free = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        """Take a buffer from the pool or allocate a new one; contents are undefined"""
+        key = (tuple(shape), np.dtype(dtype))
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                return free.pop()
+        return np.empty(shape, dtype)
+
+    def release(self, arr: np.ndarray):
+        """Return a buffer to the pool"""
+        key = (arr.shape, arr.dtype)
+        with self._lock:
+            free = self._free.setdefault(key, [])
+            self._free.move_to_end(key)
+            if len(free) < self.max_per_key:
+                free.append(arr)
+            while len(self._free) > self.max_keys:
+                self._free.popitem(last=False)
+
+    @contextmanager
+    def borrow(self, shape: Tuple[int, ...], dtype=np.uint8) -> Iterator[np.ndarray]:
+        """Borrow a buffer for the duration of a with-block"""
+        arr = self.acquire(shape, dtype)
+        try:
+            yield arr
+        finally:
+            self.release(arr)
+
+# Global pool instance
+array_pool = ArrayPool()
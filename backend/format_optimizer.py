@@ -3,49 +3,122 @@ Image format optimization and smart format selection
 """
 
 from PIL import Image
+import numpy as np
 import io
-from typing import Tuple, Dict, Any
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from typing import Tuple, Dict, Any, List, Iterable, Callable, Optional
 import logging
 
+try:
+    import simplejpeg
+    HAS_SIMPLEJPEG = True
+except ImportError:
+    simplejpeg = None
+    HAS_SIMPLEJPEG = False
+
+try:
+    import fpng_py
+    HAS_FPNG = True
+except ImportError:
+    fpng_py = None
+    HAS_FPNG = False
+
 logger = logging.getLogger(__name__)
 
+# PNG encoder for the medium/low quality levels: "fpng" or "pil"
+PNG_ENCODER = os.getenv('PNG_ENCODER', 'fpng' if HAS_FPNG else 'pil').lower()
+if PNG_ENCODER == 'fpng' and not HAS_FPNG:
+    logger.warning("PNG_ENCODER=fpng but fpng-py is not installed; using PIL")
+    PNG_ENCODER = 'pil'
+
+# Batch encode workers shared by every optimizer instance, created on first use;
+# encoders release the GIL inside C, so threads give real parallelism
+_encode_pool: Optional[ThreadPoolExecutor] = None
+_encode_pool_lock = threading.Lock()
+
+def _get_encode_pool() -> ThreadPoolExecutor:
+    """Return the shared batch encode pool, creating it if needed"""
+    global _encode_pool
+    with _encode_pool_lock:
+        if _encode_pool is None:
+            _encode_pool = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix='encode')
+        return _encode_pool
+
+def shutdown_encode_pool(wait: bool = True):
+    """Stop the shared batch encode pool; a later batch call starts a new one"""
+    global _encode_pool
+    with _encode_pool_lock:
+        pool, _encode_pool = _encode_pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait)
+
+# Read-only encoder settings shared by every optimizer instance
+_PNG_CFG = MappingProxyType({
+    'optimize': True,
+    'compress_level': 6,  # Balance between size and speed
+    'supports_transparency': True,
+    'quality_range': None
+})
+_JPEG_CFG = MappingProxyType({
+    'optimize': True,
+    'quality': 95,  # High quality for processed images
+    'supports_transparency': False,
+    'progressive': True
+})
+_WEBP_CFG = MappingProxyType({
+    'optimize': True,
+    'quality': 95,
+    'method': 6,  # Best compression
+    'supports_transparency': True,
+    'lossless': False
+})
+FORMAT_CONFIGS = MappingProxyType({
+    'PNG': _PNG_CFG,
+    'JPEG': _JPEG_CFG,
+    'WEBP': _WEBP_CFG
+})
+
+# Quality level -> encoder parameter
+_JPEG_QUALITY = {'ultra': 98, 'high': 95, 'medium': 85, 'low': 75}
+_WEBP_QUALITY = {'ultra': 98, 'high': 95, 'medium': 85, 'low': 75}
+_PNG_COMPRESS_LEVEL = {'ultra': 6, 'high': 6, 'medium': 9, 'low': 9}
+
 class ImageFormatOptimizer:
     """
     Handles image format optimization and smart format selection
     """
     
     def __init__(self):
-        self.format_configs = {
-            'PNG': {
-                'optimize': True,
-                'compress_level': 6,  # Balance between size and speed
-                'supports_transparency': True,
-                'quality_range': None
-            },
-            'JPEG': {
-                'optimize': True,
-                'quality': 95,  # High quality for processed images
-                'supports_transparency': False,
-                'progressive': True
-            },
-            'WEBP': {
-                'optimize': True,
-                'quality': 95,
-                'method': 6,  # Best compression
-                'supports_transparency': True,
-                'lossless': False
-            }
+        self.format_configs = FORMAT_CONFIGS
+        
+        # Format -> encoder; swapping an entry changes the encoder for every caller
+        self._savers: Dict[str, Callable[[Image.Image, io.BytesIO, str], None]] = {
+            'PNG': self._save_png,
+            'JPEG': self._save_jpeg,
+            'WEBP': self._save_webp
         }
+        
+        # Edge length of the crop encoded to estimate file sizes
+        self.probe_size = 256
     
-    def get_optimal_format(self, image: Image.Image, original_format: str = None) -> str:
+    def get_optimal_format(self, image: Image.Image, original_format: str = None,
+                           accept_webp: bool = True) -> str:
         """
         Determine the optimal output format based on image characteristics
         """
         has_transparency = self._has_transparency(image)
         
-        # If image has transparency, prefer PNG or WEBP
+        # If image has transparency, prefer WEBP (lossless) or PNG
         if has_transparency:
-            return 'PNG'  # PNG is more universally supported
+            # Lossless WebP is smaller and faster to encode than PNG, whatever the
+            # source format; an explicit output_format='PNG' bypasses this method
+            if accept_webp:
+                return 'WEBP'
+            return 'PNG'  # PNG for clients without WebP support
         
         # For images without transparency, consider file size and quality
         if original_format and original_format.upper() in ['JPEG', 'JPG']:
@@ -72,36 +145,10 @@ class ImageFormatOptimizer:
         """
         format = format.upper()
         
-        if format not in self.format_configs:
+        saver = self._savers.get(format)
+        if saver is None:
             raise ValueError(f"Unsupported format: {format}")
         
-        config = self.format_configs[format].copy()
-        
-        # Adjust quality based on level
-        if quality_level == 'ultra':
-            if format == 'JPEG':
-                config['quality'] = 98
-            elif format == 'WEBP':
-                config['quality'] = 98
-                config['method'] = 6
-        elif quality_level == 'high':
-            # Use default high quality settings
-            pass
-        elif quality_level == 'medium':
-            if format == 'JPEG':
-                config['quality'] = 85
-            elif format == 'WEBP':
-                config['quality'] = 85
-            elif format == 'PNG':
-                config['compress_level'] = 9  # Higher compression
-        elif quality_level == 'low':
-            if format == 'JPEG':
-                config['quality'] = 75
-            elif format == 'WEBP':
-                config['quality'] = 75
-            elif format == 'PNG':
-                config['compress_level'] = 9
-        
         # Prepare image for format
         optimized_image = self._prepare_image_for_format(image, format)
         
@@ -109,32 +156,7 @@ class ImageFormatOptimizer:
         output_buffer = io.BytesIO()
         
         try:
-            if format == 'PNG':
-                optimized_image.save(
-                    output_buffer, 
-                    format=format,
-                    optimize=config['optimize'],
-                    compress_level=config['compress_level']
-                )
-            elif format == 'JPEG':
-                optimized_image.save(
-                    output_buffer,
-                    format=format,
-                    optimize=config['optimize'],
-                    quality=config['quality'],
-                    progressive=config.get('progressive', False)
-                )
-            elif format == 'WEBP':
-                optimized_image.save(
-                    output_buffer,
-                    format=format,
-                    optimize=config['optimize'],
-                    quality=config['quality'],
-                    method=config['method'],
-                    lossless=config.get('lossless', False)
-                )
-            
-            output_buffer.seek(0)
+            saver(optimized_image, output_buffer, quality_level)
             return output_buffer.getvalue(), format
             
         except Exception as e:
@@ -146,38 +168,137 @@ class ImageFormatOptimizer:
             output_buffer.seek(0)
             return output_buffer.getvalue(), 'PNG'
     
+    def _save_png(self, image: Image.Image, buffer: io.BytesIO, quality_level: str):
+        """Encode PNG, using fpng for the size-over-fidelity levels when enabled"""
+        if PNG_ENCODER == 'fpng' and quality_level in ('medium', 'low') and image.mode in ('RGB', 'RGBA'):
+            try:
+                pixels = np.ascontiguousarray(np.asarray(image))
+                buffer.write(fpng_py.fpng_encode_image_to_memory(
+                    pixels.tobytes(), image.width, image.height, pixels.shape[2]
+                ))
+                return
+            except Exception as e:
+                logger.warning(f"fpng encode failed, falling back to PIL: {e}")
+                buffer.seek(0)
+                buffer.truncate()
+        image.save(
+            buffer,
+            format='PNG',
+            optimize=_PNG_CFG['optimize'],
+            compress_level=_PNG_COMPRESS_LEVEL.get(quality_level, _PNG_CFG['compress_level'])
+        )
+    
+    def _save_jpeg(self, image: Image.Image, buffer: io.BytesIO, quality_level: str):
+        """Encode JPEG, preferring libjpeg-turbo via simplejpeg"""
+        quality = _JPEG_QUALITY.get(quality_level, _JPEG_CFG['quality'])
+        if HAS_SIMPLEJPEG:
+            # libjpeg-turbo SIMD encoder, skips PIL's save machinery
+            try:
+                buffer.write(simplejpeg.encode_jpeg(
+                    np.ascontiguousarray(np.asarray(image)),
+                    quality=quality,
+                    colorspace='RGB',
+                    fastdct=False,
+                    progressive=_JPEG_CFG['progressive']
+                ))
+                return
+            except Exception as e:
+                logger.warning(f"simplejpeg encode failed, falling back to PIL: {e}")
+                buffer.seek(0)
+                buffer.truncate()
+        image.save(
+            buffer,
+            format='JPEG',
+            optimize=_JPEG_CFG['optimize'],
+            quality=quality,
+            progressive=_JPEG_CFG['progressive']
+        )
+    
+    def _save_webp(self, image: Image.Image, buffer: io.BytesIO, quality_level: str):
+        """Encode WEBP, lossless when the image carries transparency"""
+        quality = _WEBP_QUALITY.get(quality_level, _WEBP_CFG['quality'])
+        if image.mode == 'RGBA' and image.getchannel('A').getextrema()[0] < 255:
+            # Lossless keeps the cut-out edges exact; method 6 is too slow here
+            image.save(buffer, format='WEBP', quality=quality, method=4, lossless=True)
+        else:
+            image.save(
+                buffer,
+                format='WEBP',
+                quality=quality,
+                method=_WEBP_CFG['method'],
+                lossless=_WEBP_CFG['lossless']
+            )
+    
+    def optimize_images(self, images: Iterable[Image.Image], format: str,
+                        quality_level: str = 'high') -> List[Tuple[bytes, str]]:
+        """
+        Optimize several images in parallel, preserving input order
+        """
+        return list(_get_encode_pool().map(
+            lambda im: self.optimize_image(im, format, quality_level),
+            images
+        ))
+    
+    async def optimize_images_async(self, images: Iterable[Image.Image], format: str,
+                                    quality_level: str = 'high') -> List[Tuple[bytes, str]]:
+        """
+        Async variant of optimize_images for use from request handlers
+        """
+        loop = asyncio.get_running_loop()
+        pool = _get_encode_pool()
+        futures = [
+            loop.run_in_executor(pool, self.optimize_image, im, format, quality_level)
+            for im in images
+        ]
+        return list(await asyncio.gather(*futures))
+    
+    def close(self):
+        """Release the shared batch encode pool's threads"""
+        shutdown_encode_pool()
+    
     def _prepare_image_for_format(self, image: Image.Image, format: str) -> Image.Image:
         """
         Prepare image for specific format requirements
         """
         format = format.upper()
+        mode = image.mode
+        
+        # No-op cases need no transparency check and no conversion
+        if format == 'PNG' and mode in ('RGB', 'L', 'RGBA'):
+            return image
+        if format == 'JPEG' and mode == 'RGB':
+            return image
+        if format == 'WEBP' and mode in ('RGB', 'RGBA'):
+            return image
         
         if format == 'JPEG':
             # JPEG doesn't support transparency
-            if image.mode in ('RGBA', 'LA'):
+            if mode == 'RGBA' and image.getchannel('A').getextrema()[0] == 255:
+                # Fully opaque: dropping the alpha channel is enough
+                return image.convert('RGB')
+            if mode in ('RGBA', 'LA'):
                 # Create white background
                 background = Image.new('RGB', image.size, (255, 255, 255))
-                if image.mode == 'RGBA':
+                if mode == 'RGBA':
                     background.paste(image, mask=image.split()[-1])
                 else:
                     background.paste(image)
                 return background
-            elif image.mode != 'RGB':
-                return image.convert('RGB')
+            return image.convert('RGB')
         
-        elif format == 'PNG':
+        has_transparency = self._has_transparency(image)
+        
+        if format == 'PNG':
             # PNG supports all modes, but RGBA is preferred for transparency
-            if self._has_transparency(image) and image.mode != 'RGBA':
+            if has_transparency:
                 return image.convert('RGBA')
-            elif not self._has_transparency(image) and image.mode not in ('RGB', 'L'):
-                return image.convert('RGB')
+            return image.convert('RGB')
         
         elif format == 'WEBP':
             # WEBP supports both RGB and RGBA
-            if self._has_transparency(image) and image.mode != 'RGBA':
+            if has_transparency:
                 return image.convert('RGBA')
-            elif not self._has_transparency(image) and image.mode != 'RGB':
-                return image.convert('RGB')
+            return image.convert('RGB')
         
         return image
     
@@ -187,44 +308,29 @@ class ImageFormatOptimizer:
         """
         format = format.upper()
         if format in self.format_configs:
-            return self.format_configs[format].copy()
+            return dict(self.format_configs[format])
         return {}
     
     def estimate_file_size(self, image: Image.Image, format: str, quality_level: str = 'high') -> int:
         """
         Estimate the file size for given format and quality
+        
+        Encodes a centred probe crop with the real encoder and scales the
+        result by the pixel-area ratio.
         """
-        # This is a rough estimation based on image dimensions and format
+        format = format.upper()
         width, height = image.size
-        pixels = width * height
-        
-        if format.upper() == 'PNG':
-            # PNG size depends on image complexity, rough estimate
-            if self._has_transparency(image):
-                return int(pixels * 4 * 0.7)  # RGBA with compression
-            else:
-                return int(pixels * 3 * 0.7)  # RGB with compression
-        
-        elif format.upper() == 'JPEG':
-            quality_multiplier = {
-                'ultra': 0.8,
-                'high': 0.6,
-                'medium': 0.4,
-                'low': 0.2
-            }
-            return int(pixels * 3 * quality_multiplier.get(quality_level, 0.6))
-        
-        elif format.upper() == 'WEBP':
-            quality_multiplier = {
-                'ultra': 0.7,
-                'high': 0.5,
-                'medium': 0.3,
-                'low': 0.15
-            }
-            multiplier = quality_multiplier.get(quality_level, 0.5)
-            if self._has_transparency(image):
-                return int(pixels * 4 * multiplier)
-            else:
-                return int(pixels * 3 * multiplier)
-        
-        return int(pixels * 3)  # Default estimate
+        
+        saver = self._savers.get(format)
+        if saver is None:
+            return int(width * height * 3)  # Default estimate
+        
+        probe_width = min(width, self.probe_size)
+        probe_height = min(height, self.probe_size)
+        left = (width - probe_width) // 2
+        top = (height - probe_height) // 2
+        probe = image.crop((left, top, left + probe_width, top + probe_height))
+        
+        buffer = io.BytesIO()
+        saver(self._prepare_image_for_format(probe, format), buffer, quality_level)
+        return int(buffer.tell() * (width * height) / (probe_width * probe_height))
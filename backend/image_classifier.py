@@ -5,11 +5,28 @@ Image classification for automatic model selection based on image content
 import numpy as np
 from PIL import Image
 import cv2
+import copy
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
 from typing import Dict, Tuple, List
 import logging
 
 logger = logging.getLogger(__name__)
 
+@dataclass
+class _AnalysisContext:
+    """
+    Per-image buffers shared by the analyzers, computed once per classification
+    """
+    rgb: np.ndarray
+    gray: np.ndarray
+    hsv: np.ndarray
+    sobel_x: np.ndarray
+    sobel_y: np.ndarray
+    canny: np.ndarray
+    skin: np.ndarray
+
 class ImageClassifier:
     """
     Classifies images to determine the best processing approach
@@ -34,6 +51,32 @@ class ImageClassifier:
                 'description': 'General purpose images'
             }
         }
+        
+        # Longest side used for analysis; only statistics are needed
+        self.analysis_size = 512
+        
+        # Results keyed by (difference hash, width, height); classification is pure
+        self.cache_size = 1024
+        self._cache: "OrderedDict[Tuple[int, int, int], Dict[str, any]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        
+        # Skin-tone lookup table indexed by RGB packed to 5 bits per channel
+        self._skin_lut = self._build_skin_lut()
+    
+    @staticmethod
+    def _build_skin_lut() -> np.ndarray:
+        """
+        Precompute the YCrCb skin test for all 32768 5-bit RGB tuples
+        """
+        levels = np.arange(32, dtype=np.uint8)
+        r, g, b = np.meshgrid(levels, levels, levels, indexing='ij')
+        # Expand 5-bit levels back to 8 bits, sampling the bucket centre
+        rgb = (np.stack([r, g, b], axis=-1) << 3) | 4
+        ycrcb = cv2.cvtColor(rgb.reshape(-1, 1, 3), cv2.COLOR_RGB2YCrCb)
+        
+        lower_skin = np.array([0, 133, 77], dtype=np.uint8)
+        upper_skin = np.array([255, 173, 127], dtype=np.uint8)
+        return cv2.inRange(ycrcb, lower_skin, upper_skin).ravel()
     
     def classify_image(self, image: Image.Image) -> Dict[str, any]:
         """
@@ -41,9 +84,29 @@ class ImageClassifier:
         """
         # Convert to numpy array for analysis
         img_array = np.array(image.convert('RGB'))
+        height, width = img_array.shape[:2]
+        
+        # Work on a bounded-size thumbnail
+        scale = self.analysis_size / max(height, width)
+        if scale < 1.0:
+            img_array = cv2.resize(
+                img_array,
+                (max(1, int(width * scale)), max(1, int(height * scale))),
+                interpolation=cv2.INTER_AREA
+            )
+        
+        # Repeated uploads of the same picture skip the analysis entirely
+        key = (self._difference_hash(img_array), width, height)
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return copy.deepcopy(cached)  # Callers may mutate the result
         
         # Analyze image characteristics
         characteristics = self._analyze_image_characteristics(img_array)
+        characteristics['aspect_ratio'] = width / height
+        characteristics['dimensions'] = (width, height)
         
         # Determine image type based on characteristics
         image_type = self._determine_image_type(characteristics)
@@ -51,7 +114,7 @@ class ImageClassifier:
         # Get recommended model
         recommended_model = self.image_types[image_type]['models'][0]
         
-        return {
+        result = {
             'type': image_type,
             'recommended_model': recommended_model,
             'alternative_models': self.image_types[image_type]['models'][1:],
@@ -59,6 +122,22 @@ class ImageClassifier:
             'characteristics': characteristics,
             'description': self.image_types[image_type]['description']
         }
+        
+        with self._cache_lock:
+            self._cache[key] = copy.deepcopy(result)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        
+        return result
+    
+    @staticmethod
+    def _difference_hash(img_array: np.ndarray) -> int:
+        """
+        64-bit difference hash of a 9x8 grayscale thumbnail
+        """
+        thumb = cv2.resize(img_array, (9, 8), interpolation=cv2.INTER_AREA).mean(axis=-1)
+        bits = (thumb[:, 1:] > thumb[:, :-1]).ravel()
+        return int.from_bytes(np.packbits(bits).tobytes(), 'big')
     
     def _analyze_image_characteristics(self, img_array: np.ndarray) -> Dict[str, any]:
         """
@@ -69,20 +148,23 @@ class ImageClassifier:
         # Aspect ratio analysis
         aspect_ratio = width / height
         
+        # Color conversions, edges and skin mask are shared by all analyzers
+        ctx = self._build_context(img_array)
+        
         # Color analysis
-        color_stats = self._analyze_colors(img_array)
+        color_stats = self._analyze_colors(ctx)
         
         # Edge analysis
-        edge_stats = self._analyze_edges(img_array)
+        edge_stats = self._analyze_edges(ctx)
         
         # Face detection (simple approach)
-        face_stats = self._detect_faces_simple(img_array)
+        face_stats = self._detect_faces_simple(ctx)
         
         # Object detection hints
-        object_stats = self._analyze_objects(img_array)
+        object_stats = self._analyze_objects(ctx)
         
         # Complexity analysis
-        complexity = self._analyze_complexity(img_array)
+        complexity = self._analyze_complexity(ctx)
         
         return {
             'aspect_ratio': aspect_ratio,
@@ -95,23 +177,50 @@ class ImageClassifier:
             'confidence': 0.8  # Base confidence
         }
     
-    def _analyze_colors(self, img_array: np.ndarray) -> Dict[str, any]:
+    def _build_context(self, img_array: np.ndarray) -> _AnalysisContext:
+        """
+        Compute the derived images every analyzer needs, once
+        """
+        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+        
+        # One 3x3 Sobel pass feeds both the gradient statistics and Canny;
+        # replicate borders match what Canny uses internally
+        sobel_x = cv2.Sobel(gray, cv2.CV_16S, 1, 0, ksize=3, borderType=cv2.BORDER_REPLICATE)
+        sobel_y = cv2.Sobel(gray, cv2.CV_16S, 0, 1, ksize=3, borderType=cv2.BORDER_REPLICATE)
+        
+        return _AnalysisContext(
+            rgb=img_array,
+            gray=gray,
+            hsv=cv2.cvtColor(img_array, cv2.COLOR_RGB2HSV),
+            sobel_x=sobel_x,
+            sobel_y=sobel_y,
+            canny=cv2.Canny(sobel_x, sobel_y, 50, 150),
+            skin=self._detect_skin_tones(img_array)
+        )
+    
+    def _analyze_colors(self, ctx: _AnalysisContext) -> Dict[str, any]:
         """
         Analyze color distribution and characteristics
         """
-        # Convert to different color spaces for analysis
-        hsv = cv2.cvtColor(img_array, cv2.COLOR_RGB2HSV)
+        img_array = ctx.rgb
+        hsv = ctx.hsv
         
         # Calculate color statistics
-        mean_rgb = np.mean(img_array, axis=(0, 1))
-        std_rgb = np.std(img_array, axis=(0, 1))
+        mean_rgb, std_rgb = cv2.meanStdDev(img_array)
+        mean_rgb = mean_rgb.ravel()
+        std_rgb = std_rgb.ravel()
         
         # Skin tone detection (rough approximation)
-        skin_mask = self._detect_skin_tones(img_array)
-        skin_percentage = np.sum(skin_mask) / (img_array.shape[0] * img_array.shape[1])
-        
-        # Color diversity
-        unique_colors = len(np.unique(img_array.reshape(-1, 3), axis=0))
+        skin_mask = ctx.skin
+        skin_percentage = cv2.countNonZero(skin_mask.view(np.uint8)) / (img_array.shape[0] * img_array.shape[1])
+        
+        # Color diversity: mark packed 24-bit colors in a presence bitmap
+        packed = (img_array[:, :, 0].astype(np.uint32)
+                  | (img_array[:, :, 1].astype(np.uint32) << 8)
+                  | (img_array[:, :, 2].astype(np.uint32) << 16)).ravel()
+        seen = np.zeros(1 << 24, dtype=bool)
+        seen[packed] = True
+        unique_colors = int(np.count_nonzero(seen))
         color_diversity = unique_colors / (img_array.shape[0] * img_array.shape[1])
         
         return {
@@ -119,47 +228,47 @@ class ImageClassifier:
             'std_rgb': std_rgb.tolist(),
             'skin_percentage': skin_percentage,
             'color_diversity': color_diversity,
-            'dominant_hue': np.mean(hsv[:, :, 0])
+            'dominant_hue': cv2.mean(hsv[:, :, 0])[0]
         }
     
-    def _analyze_edges(self, img_array: np.ndarray) -> Dict[str, any]:
+    def _analyze_edges(self, ctx: _AnalysisContext) -> Dict[str, any]:
         """
         Analyze edge characteristics
         """
-        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+        edges = ctx.canny
         
-        # Canny edge detection
-        edges = cv2.Canny(gray, 50, 150)
-        edge_density = np.sum(edges > 0) / (edges.shape[0] * edges.shape[1])
+        # Canny edge density
+        edge_density = cv2.countNonZero(edges) / (edges.shape[0] * edges.shape[1])
         
-        # Sobel gradients for texture analysis
-        sobel_x = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
-        sobel_y = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
-        gradient_magnitude = np.sqrt(sobel_x**2 + sobel_y**2)
+        # Sobel gradients for texture analysis (int16 is exact for 3x3 on uint8)
+        gradient_magnitude = cv2.magnitude(ctx.sobel_x.astype(np.float32), ctx.sobel_y.astype(np.float32))
+        mean, std = cv2.meanStdDev(gradient_magnitude)
         
         return {
             'edge_density': edge_density,
-            'mean_gradient': np.mean(gradient_magnitude),
-            'gradient_std': np.std(gradient_magnitude)
+            'mean_gradient': float(mean[0, 0]),
+            'gradient_std': float(std[0, 0])
         }
     
-    def _detect_faces_simple(self, img_array: np.ndarray) -> Dict[str, any]:
+    def _detect_faces_simple(self, ctx: _AnalysisContext) -> Dict[str, any]:
         """
         Simple face detection using basic image analysis
         """
         # This is a simplified approach - in production, you might use
         # more sophisticated face detection libraries
         
-        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-        height, width = gray.shape
+        height, width = ctx.gray.shape
         
         # Look for face-like characteristics
         # Check for oval/circular regions with skin tones
-        skin_mask = self._detect_skin_tones(img_array)
+        skin_mask = ctx.skin
         
         # Simple heuristic: if significant skin tones in upper portion
         upper_half = skin_mask[:height//2, :]
-        upper_skin_percentage = np.sum(upper_half) / (upper_half.shape[0] * upper_half.shape[1])
+        if upper_half.size:
+            upper_skin_percentage = cv2.countNonZero(upper_half.view(np.uint8)) / upper_half.size
+        else:
+            upper_skin_percentage = 0.0  # One-row thumbnail (e.g. a very wide banner) has no upper half
         
         # Estimate face probability based on skin distribution and image characteristics
         face_probability = min(upper_skin_percentage * 2, 1.0)
@@ -174,74 +283,87 @@ class ImageClassifier:
         """
         Detect skin tones in the image
         """
-        # Convert to YCrCb color space for better skin detection
-        ycrcb = cv2.cvtColor(img_array, cv2.COLOR_RGB2YCrCb)
-        
-        # Define skin color range in YCrCb
-        lower_skin = np.array([0, 133, 77], dtype=np.uint8)
-        upper_skin = np.array([255, 173, 127], dtype=np.uint8)
+        height, width = img_array.shape[:2]
         
-        # Create mask for skin colors
-        skin_mask = cv2.inRange(ycrcb, lower_skin, upper_skin)
+        # Single gather through the precomputed YCrCb threshold table
+        idx = ((img_array[:, :, 0] >> 3).astype(np.uint16) << 10) \
+            | ((img_array[:, :, 1] >> 3).astype(np.uint16) << 5) \
+            | (img_array[:, :, 2] >> 3)
+        skin_mask = self._skin_lut[idx]
         
-        # Apply morphological operations to clean up the mask
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-        skin_mask = cv2.morphologyEx(skin_mask, cv2.MORPH_CLOSE, kernel)
-        skin_mask = cv2.morphologyEx(skin_mask, cv2.MORPH_OPEN, kernel)
+        # Clean up the mask at quarter resolution; it only feeds percentages
+        small = np.ascontiguousarray(skin_mask[::4, ::4])
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+        small = cv2.morphologyEx(small, cv2.MORPH_CLOSE, kernel)
+        small = cv2.morphologyEx(small, cv2.MORPH_OPEN, kernel)
+        skin_mask = cv2.resize(small, (width, height), interpolation=cv2.INTER_NEAREST)
         
         return skin_mask > 0
     
-    def _analyze_objects(self, img_array: np.ndarray) -> Dict[str, any]:
+    def _analyze_objects(self, ctx: _AnalysisContext) -> Dict[str, any]:
         """
         Analyze for object-like characteristics
         """
-        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+        edges = ctx.canny
         
         # Look for geometric shapes and patterns
         # This is a simplified approach
         
-        # Contour analysis
-        edges = cv2.Canny(gray, 50, 150)
-        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        # Connected edge components with per-component bounding boxes in one pass
+        num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(edges, connectivity=8)
+        widths = stats[1:, cv2.CC_STAT_WIDTH]
+        heights = stats[1:, cv2.CC_STAT_HEIGHT]
         
-        # Analyze contour characteristics
-        large_contours = [c for c in contours if cv2.contourArea(c) > 1000]
+        # Bounding-box area stands in for the enclosed contour area
+        large = np.flatnonzero(widths * heights > 1000)
         geometric_shapes = 0
         
-        for contour in large_contours:
-            # Approximate contour to polygon
-            epsilon = 0.02 * cv2.arcLength(contour, True)
-            approx = cv2.approxPolyDP(contour, epsilon, True)
-            
-            # Count geometric shapes (triangles, rectangles, etc.)
-            if len(approx) >= 3 and len(approx) <= 8:
-                geometric_shapes += 1
+        if len(large) <= 20:
+            for index in large:
+                label = index + 1
+                x, y, w, h = stats[label, :4]
+                component = (labels[y:y + h, x:x + w] == label).astype(np.uint8)
+                contours, _ = cv2.findContours(component, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+                contour = max(contours, key=cv2.contourArea)
+                
+                # Approximate contour to polygon
+                epsilon = 0.02 * cv2.arcLength(contour, True)
+                approx = cv2.approxPolyDP(contour, epsilon, True)
+                
+                # Count geometric shapes (triangles, rectangles, etc.)
+                if len(approx) >= 3 and len(approx) <= 8:
+                    geometric_shapes += 1
+        else:
+            # Too many components to trace one by one: count boxes that are
+            # not thin slivers
+            aspect = widths[large] / heights[large]
+            geometric_shapes = int(np.count_nonzero((aspect > 0.2) & (aspect < 5.0)))
         
         return {
-            'contour_count': len(contours),
-            'large_contour_count': len(large_contours),
+            'contour_count': num_labels - 1,
+            'large_contour_count': len(large),
             'geometric_shapes': geometric_shapes,
-            'object_likelihood': min(geometric_shapes / max(len(large_contours), 1), 1.0)
+            'object_likelihood': min(geometric_shapes / max(len(large), 1), 1.0)
         }
     
-    def _analyze_complexity(self, img_array: np.ndarray) -> Dict[str, any]:
+    def _analyze_complexity(self, ctx: _AnalysisContext) -> Dict[str, any]:
         """
         Analyze image complexity
         """
-        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+        gray = ctx.gray
         
         # Calculate image entropy (measure of information content)
-        hist = cv2.calcHist([gray], [0], None, [256], [0, 256])
-        hist = hist.flatten()
-        hist = hist[hist > 0]  # Remove zero entries
-        entropy = -np.sum(hist * np.log2(hist / np.sum(hist)))
+        counts = np.bincount(gray.ravel(), minlength=256)
+        p = counts[counts > 0].astype(np.float64)
+        p /= p.sum()
+        entropy = float(-(p * np.log2(p)).sum())
         
         # Texture analysis using Local Binary Patterns (simplified)
-        texture_score = np.std(gray)
+        texture_score = float(cv2.meanStdDev(gray)[1][0, 0])
         
         # Detail level based on high-frequency content
         laplacian = cv2.Laplacian(gray, cv2.CV_64F)
-        detail_score = np.var(laplacian)
+        detail_score = float(cv2.meanStdDev(laplacian)[1][0, 0] ** 2)
         
         return {
             'entropy': entropy,
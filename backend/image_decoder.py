@@ -0,0 +1,51 @@
+"""
+Upload decoding with a libjpeg-turbo fast path for JPEG input
+"""
+
+import io
+from typing import BinaryIO, Union
+from PIL import Image
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Optional TurboJPEG bindings; also needs the libturbojpeg shared library at runtime
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    _turbojpeg = TurboJPEG()
+    HAS_TURBOJPEG = True
+except Exception:
+    _turbojpeg = None
+    HAS_TURBOJPEG = False
+
+JPEG_MAGIC = b'\xff\xd8\xff'
+
+def decode_image(source: Union[bytes, BinaryIO]) -> Image.Image:
+    """
+    Decode an uploaded image from bytes or a binary file object
+
+    JPEGs are decoded by TurboJPEG straight into an RGB array when it is
+    installed; other formats, and JPEGs it rejects (e.g. CMYK), use PIL.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data, fileobj = source, None
+    else:
+        data, fileobj = None, source
+        fileobj.seek(0)
+
+    if HAS_TURBOJPEG:
+        head = bytes(data[:3]) if data is not None else fileobj.read(3)
+        if head == JPEG_MAGIC:
+            if data is None:
+                fileobj.seek(0)
+                data = fileobj.read()
+            try:
+                return Image.fromarray(_turbojpeg.decode(data, pixel_format=TJPF_RGB), 'RGB')
+            except Exception as e:
+                logger.debug(f"TurboJPEG decode failed, using PIL: {e}")
+
+    if data is not None:
+        return Image.open(io.BytesIO(data))
+
+    fileobj.seek(0)
+    return Image.open(fileobj)
@@ -2,17 +2,78 @@
 Image storage system for persistent image management
 """
 
+import io
 import os
 import json
 import uuid
 import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 from pathlib import Path
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Image payloads may be any contiguous byte buffer. The file write never copies, but the
+# thumbnail's io.BytesIO only shares a bytes object and copies any other buffer type
+BytesLike = Union[bytes, bytearray, memoryview]
+
+# Record fields stored as their own columns; the free-form "metadata" dict
+# lives in metadata_json and is only decoded when a row is read
+_COLUMNS = (
+    'id', 'filename', 'original_filename', 'type', 'parent_id', 'file_path',
+    'thumbnail_path', 'file_size', 'created_at_ns', 'updated_at_ns'
+)
+
+# ISO timestamps returned by the API, derived from the *_ns columns on read
+_TIMESTAMP_FIELDS = (('created_at', 'created_at_ns'), ('updated_at', 'updated_at_ns'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id TEXT PRIMARY KEY,
+    filename TEXT,
+    original_filename TEXT,
+    type TEXT,
+    parent_id TEXT,
+    file_path TEXT,
+    thumbnail_path TEXT,
+    file_size INTEGER,
+    created_at_ns INTEGER,
+    updated_at_ns INTEGER,
+    metadata_json TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_images_type ON images(type);
+CREATE INDEX IF NOT EXISTS idx_images_parent_id ON images(parent_id);
+CREATE INDEX IF NOT EXISTS idx_images_created_at_ns ON images(created_at_ns DESC);
+"""
+
+def _iso_to_ns(value: Optional[str]) -> Optional[int]:
+    """Convert a local-time ISO timestamp to integer nanoseconds since the epoch"""
+    if not value:
+        return None
+    return int(datetime.fromisoformat(value).timestamp() * 1_000_000_000)
+
+def _ns_to_iso(value: Optional[int]) -> Optional[str]:
+    """Convert integer nanoseconds since the epoch to a local-time ISO timestamp"""
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value / 1_000_000_000).isoformat()
+
+# An image and all of its processed/edited descendants, via the parent_id index
+_DESCENDANTS_SQL = """
+WITH RECURSIVE descendants(id) AS (
+    SELECT id FROM images WHERE id = ?
+    UNION ALL
+    SELECT images.id FROM images JOIN descendants ON images.parent_id = descendants.id
+)
+SELECT id, file_path, thumbnail_path FROM images JOIN descendants USING (id)
+"""
+
 class ImageStorage:
     """
     Handles persistent storage of images and their metadata
@@ -20,7 +81,8 @@ class ImageStorage:
     
     def __init__(self, storage_dir: str = "stored_images"):
         self.storage_dir = Path(storage_dir)
-        self.metadata_file = self.storage_dir / "metadata.json"
+        self.db_file = self.storage_dir / "metadata.db"
+        self.metadata_file = self.storage_dir / "metadata.json"  # Legacy store, imported once
         self.images_dir = self.storage_dir / "images"
         self.thumbnails_dir = self.storage_dir / "thumbnails"
         
@@ -29,30 +91,161 @@ class ImageStorage:
         self.images_dir.mkdir(exist_ok=True)
         self.thumbnails_dir.mkdir(exist_ok=True)
         
-        # Initialize metadata file
-        if not self.metadata_file.exists():
-            self._save_metadata({})
+        # Initialize metadata database
+        self._lock = threading.RLock()
+        # Generous busy timeout: uvicorn workers start together and queue on the schema and import writes
+        self._db = sqlite3.connect(str(self.db_file), timeout=30, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        
+        # LRU cache of decoded records by ID; PRAGMA data_version changes when
+        # another connection commits, which invalidates the whole cache
+        self.cache_size = 1024
+        self._cache = OrderedDict()
+        self._data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        
+        if self.metadata_file.exists():
+            self._import_json_metadata()
+        
+        # Workers for file writes and thumbnails; PIL releases the GIL while decoding.
+        # File writes get their own pool so batch workers never wait on their own pool
+        self._pool = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+        self._io_pool = ThreadPoolExecutor(max_workers=4)
     
-    def _load_metadata(self) -> Dict:
-        """Load metadata from JSON file"""
+    def _import_json_metadata(self):
+        """Move records from the legacy metadata.json into the database"""
+        with self._lock, self._db:
+            # Take the write lock before reading, so when several worker processes
+            # start at once the others wait here and then find the file already moved
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                with open(self.metadata_file, 'r') as f:
+                    metadata = json.load(f)
+            except FileNotFoundError:
+                return  # Imported by another worker
+            except (OSError, json.JSONDecodeError) as e:
+                logger.error(f"Could not read legacy metadata file: {e}")
+                return
+            
+            self._db.executemany(
+                f"INSERT OR IGNORE INTO images ({', '.join(_COLUMNS)}, metadata_json) "
+                f"VALUES ({', '.join('?' * (len(_COLUMNS) + 1))})",
+                [self._record_values(record) for record in metadata.values()]
+            )
+        
         try:
-            with open(self.metadata_file, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
+            self.metadata_file.rename(self.metadata_file.with_suffix('.json.migrated'))
+        except FileNotFoundError:
+            pass  # A worker that re-read it before the rename moved it first; INSERT OR IGNORE made that harmless
+        logger.info(f"Imported {len(metadata)} records from {self.metadata_file}")
+    
+    @staticmethod
+    def _record_values(record: Dict) -> tuple:
+        """Column values for a metadata record, in _COLUMNS order"""
+        values = dict(record)
+        for iso_field, ns_field in _TIMESTAMP_FIELDS:
+            if values.get(ns_field) is None:
+                values[ns_field] = _iso_to_ns(values.get(iso_field))  # Legacy JSON records
+        return tuple(values.get(column) for column in _COLUMNS) + \
+            (json.dumps(record.get('metadata') or {}, default=str),)
+    
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict:
+        """Decode a database row into the metadata record returned by the API"""
+        record = {column: row[column] for column in _COLUMNS}
+        for iso_field, ns_field in _TIMESTAMP_FIELDS:
+            record[iso_field] = _ns_to_iso(record[ns_field])
+        record['metadata'] = json.loads(row['metadata_json'] or '{}')
+        return record
+    
+    @staticmethod
+    def _copy_record(record: Dict) -> Dict:
+        """Copy a cached record so callers can't mutate the cache"""
+        record = dict(record)
+        record['metadata'] = dict(record['metadata'])
+        return record
     
-    def _save_metadata(self, metadata: Dict):
-        """Save metadata to JSON file"""
-        with open(self.metadata_file, 'w') as f:
-            json.dump(metadata, f, indent=2, default=str)
+    def _check_data_version(self):
+        """Drop the cache if another process has committed since the last check"""
+        data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version:
+            self._data_version = data_version
+            self._cache.clear()
     
-    def store_image(self, image_data: bytes, filename: str, image_type: str = "original", 
+    def _get(self, image_id: str) -> Optional[Dict]:
+        """Fetch one metadata record"""
+        with self._lock:
+            self._check_data_version()
+            record = self._cache.get(image_id)
+            if record is not None:
+                self._cache.move_to_end(image_id)
+                return self._copy_record(record)
+            
+            row = self._db.execute("SELECT * FROM images WHERE id = ?", (image_id,)).fetchone()
+            if row is None:
+                return None
+            
+            record = self._row_to_dict(row)
+            self._cache[image_id] = record
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return self._copy_record(record)
+    
+    def _put(self, image_id: str, record: Dict):
+        """Insert or replace one metadata record"""
+        record['id'] = image_id
+        with self._lock, self._db:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO images ({', '.join(_COLUMNS)}, metadata_json) "
+                f"VALUES ({', '.join('?' * (len(_COLUMNS) + 1))})",
+                self._record_values(record)
+            )
+            self._cache.pop(image_id, None)
+    
+    def _put_many(self, records: Sequence[Dict]):
+        """Insert several metadata records in a single transaction"""
+        with self._lock, self._db:
+            self._db.executemany(
+                f"INSERT OR REPLACE INTO images ({', '.join(_COLUMNS)}, metadata_json) "
+                f"VALUES ({', '.join('?' * (len(_COLUMNS) + 1))})",
+                [self._record_values(record) for record in records]
+            )
+            for record in records:
+                self._cache.pop(record['id'], None)
+    
+    def _query(self, image_type: str = None, parent_id: str = None,
+               limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        """Records matching the optional filters, newest first"""
+        clauses, params = [], []
+        if image_type:
+            clauses.append("type = ?")
+            params.append(image_type)
+        if parent_id:
+            clauses.append("parent_id = ?")
+            params.append(parent_id)
+        
+        sql = "SELECT * FROM images"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY created_at_ns DESC"
+        if limit is not None or offset:
+            # SQLite needs a LIMIT clause for OFFSET; -1 means unbounded
+            sql += " LIMIT ? OFFSET ?"
+            params.extend((-1 if limit is None else limit, offset))
+        
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+    
+    def store_image(self, image_data: BytesLike, filename: str, image_type: str = "original", 
                    parent_id: str = None, metadata: Dict = None) -> str:
         """
         Store an image and return its unique ID
         
         Args:
-            image_data: Raw image bytes
+            image_data: Raw image bytes or a byte buffer (memoryview, bytearray)
             filename: Original filename
             image_type: Type of image (original, processed, edited)
             parent_id: ID of parent image (for processed/edited versions)
@@ -61,24 +254,49 @@ class ImageStorage:
         Returns:
             Unique image ID
         """
+        image_metadata = self._write_image(image_data, filename, image_type, parent_id, metadata)
+        self._put(image_metadata['id'], image_metadata)
+        
+        logger.info(f"Stored image {image_metadata['id']} ({image_type})")
+        return image_metadata['id']
+    
+    def store_images_batch(self, items: Sequence[Tuple[bytes, str, str, Optional[str], Optional[Dict]]]) -> List[str]:
+        """
+        Store several images, committing all metadata in one transaction
+        
+        Args:
+            items: (image_data, filename, image_type, parent_id, metadata) tuples
+        
+        Returns:
+            Unique image IDs, in input order
+        """
+        records = list(self._pool.map(lambda item: self._write_image(*item), items))
+        self._put_many(records)
+        
+        logger.info(f"Stored batch of {len(records)} images")
+        return [record['id'] for record in records]
+    
+    def _write_image(self, image_data: BytesLike, filename: str, image_type: str = "original",
+                     parent_id: str = None, metadata: Dict = None) -> Dict:
+        """Write the image file and thumbnail; return the metadata record to persist"""
         image_id = str(uuid.uuid4())
-        timestamp = datetime.now().isoformat()
+        timestamp = time.time_ns()
         
         # Determine file extension
         ext = Path(filename).suffix.lower()
         if not ext:
             ext = '.png'  # Default extension
         
-        # Save image file
+        # Save image file in the background while the thumbnail is built from memory
         image_path = self.images_dir / f"{image_id}{ext}"
-        with open(image_path, 'wb') as f:
-            f.write(image_data)
+        write_future = self._io_pool.submit(self._write_file, image_path, image_data)
         
         # Create thumbnail
-        thumbnail_path = self._create_thumbnail(image_path, image_id)
+        thumbnail_path = self._create_thumbnail(image_data, image_id)
+        write_future.result()
         
         # Prepare metadata
-        image_metadata = {
+        return {
             "id": image_id,
             "filename": filename,
             "original_filename": filename,
@@ -87,27 +305,42 @@ class ImageStorage:
             "file_path": str(image_path),
             "thumbnail_path": str(thumbnail_path) if thumbnail_path else None,
             "file_size": len(image_data),
-            "created_at": timestamp,
-            "updated_at": timestamp,
+            "created_at_ns": timestamp,
+            "updated_at_ns": timestamp,
             "metadata": metadata or {}
         }
-        
-        # Load existing metadata and add new entry
-        all_metadata = self._load_metadata()
-        all_metadata[image_id] = image_metadata
-        self._save_metadata(all_metadata)
-        
-        logger.info(f"Stored image {image_id} ({image_type})")
-        return image_id
     
-    def _create_thumbnail(self, image_path: Path, image_id: str) -> Optional[Path]:
-        """Create a thumbnail for the image"""
+    @staticmethod
+    def _write_file(path: Path, data: BytesLike):
+        """Write bytes with unbuffered os-level writes, skipping the Python file buffer"""
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+        fd = os.open(str(path), flags, 0o644)
+        try:
+            if hasattr(os, 'posix_fallocate') and data:
+                try:
+                    os.posix_fallocate(fd, 0, len(data))
+                except OSError:
+                    pass  # Not supported by every filesystem
+            
+            view = memoryview(data)
+            while view:
+                written = os.write(fd, view)
+                view = view[written:]
+        finally:
+            os.close(fd)
+    
+    def _create_thumbnail(self, image_data: BytesLike, image_id: str) -> Optional[Path]:
+        """Create a thumbnail from the in-memory image bytes"""
         try:
             from PIL import Image
             
-            with Image.open(image_path) as img:
+            with Image.open(io.BytesIO(image_data)) as img:
+                # Let libjpeg downscale in the DCT domain while decoding
+                if img.format == 'JPEG':
+                    img.draft('RGB', (200, 200))
+                
                 # Create thumbnail (max 200x200)
-                img.thumbnail((200, 200), Image.Resampling.LANCZOS)
+                img.thumbnail((200, 200), Image.Resampling.HAMMING)
                 
                 thumbnail_path = self.thumbnails_dir / f"{image_id}_thumb.jpg"
                 
@@ -121,7 +354,7 @@ class ImageStorage:
                         background.paste(img, mask=img.split()[-1])
                     img = background
                 
-                img.save(thumbnail_path, 'JPEG', quality=85)
+                img.save(thumbnail_path, 'JPEG', quality=70, optimize=True, progressive=True, subsampling=2)
                 return thumbnail_path
                 
         except Exception as e:
@@ -130,8 +363,7 @@ class ImageStorage:
     
     def get_image(self, image_id: str) -> Optional[Dict]:
         """Get image metadata by ID"""
-        metadata = self._load_metadata()
-        return metadata.get(image_id)
+        return self._get(image_id)
     
     def get_image_data(self, image_id: str) -> Optional[bytes]:
         """Get raw image data by ID"""
@@ -159,43 +391,45 @@ class ImageStorage:
             logger.error(f"Thumbnail not found: {image_info['thumbnail_path']}")
             return None
     
-    def list_images(self, image_type: str = None, parent_id: str = None) -> List[Dict]:
+    def list_images(self, image_type: str = None, parent_id: str = None,
+                    limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
         """
         List stored images with optional filtering
         
         Args:
             image_type: Filter by image type (original, processed, edited)
             parent_id: Filter by parent image ID
+            limit: Maximum number of images to return (all if None)
+            offset: Number of images to skip, for pagination
         
         Returns:
-            List of image metadata
+            List of image metadata, newest first
         """
-        metadata = self._load_metadata()
-        images = list(metadata.values())
-        
-        # Apply filters
-        if image_type:
-            images = [img for img in images if img.get('type') == image_type]
-        
-        if parent_id:
-            images = [img for img in images if img.get('parent_id') == parent_id]
-        
-        # Sort by creation date (newest first)
-        images.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-        
-        return images
+        return self._query(image_type=image_type, parent_id=parent_id, limit=limit, offset=offset)
     
     def update_image_metadata(self, image_id: str, updates: Dict) -> bool:
         """Update image metadata"""
-        metadata = self._load_metadata()
+        record = self._get(image_id)
         
-        if image_id not in metadata:
+        if record is None:
             return False
         
-        metadata[image_id].update(updates)
-        metadata[image_id]['updated_at'] = datetime.now().isoformat()
+        updates = dict(updates)
+        for iso_field, ns_field in _TIMESTAMP_FIELDS:
+            if iso_field in updates:
+                # Public ISO timestamps map onto their integer columns
+                updates[ns_field] = _iso_to_ns(updates.pop(iso_field))
+        
+        unknown = set(updates) - set(_COLUMNS) - {'metadata'}
+        if unknown:
+            logger.warning(f"Ignoring unknown fields for {image_id}: {sorted(unknown)}")
+            for field in unknown:
+                del updates[field]
         
-        self._save_metadata(metadata)
+        record.update(updates)
+        record['updated_at_ns'] = time.time_ns()
+        
+        self._put(image_id, record)
         return True
     
     def delete_image(self, image_id: str, delete_children: bool = True) -> bool:
@@ -204,57 +438,72 @@ class ImageStorage:
         
         Args:
             image_id: ID of image to delete
-            delete_children: Whether to delete processed/edited versions
+            delete_children: Whether to delete processed/edited versions, recursively
         
         Returns:
             True if successful
         """
-        metadata = self._load_metadata()
-        
-        if image_id not in metadata:
-            return False
-        
-        image_info = metadata[image_id]
-        
-        # Delete child images if requested
         if delete_children:
-            children = [img for img in metadata.values() if img.get('parent_id') == image_id]
-            for child in children:
-                self.delete_image(child['id'], delete_children=False)
-        
-        # Delete image files
-        try:
-            if os.path.exists(image_info['file_path']):
-                os.remove(image_info['file_path'])
+            sql = _DESCENDANTS_SQL
+        else:
+            sql = "SELECT id, file_path, thumbnail_path FROM images WHERE id = ?"
+        
+        # Remove all metadata rows in one transaction
+        with self._lock, self._db:
+            rows = self._db.execute(sql, (image_id,)).fetchall()
+            if not rows:
+                return False
             
-            if image_info.get('thumbnail_path') and os.path.exists(image_info['thumbnail_path']):
-                os.remove(image_info['thumbnail_path'])
-        except Exception as e:
-            logger.error(f"Error deleting files for {image_id}: {e}")
+            self._db.executemany("DELETE FROM images WHERE id = ?", [(row['id'],) for row in rows])
+            for row in rows:
+                self._cache.pop(row['id'], None)
         
-        # Remove from metadata
-        del metadata[image_id]
-        self._save_metadata(metadata)
-        
-        logger.info(f"Deleted image {image_id}")
+        # Delete image files
+        for row in rows:
+            for path in (row['file_path'], row['thumbnail_path']):
+                if not path:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except Exception as e:
+                    logger.error(f"Error deleting file {path} for {row['id']}: {e}")
+        
+        logger.info(f"Deleted image {image_id} ({len(rows) - 1} descendants)")
         return True
     
     def get_storage_stats(self) -> Dict:
         """Get storage statistics"""
-        metadata = self._load_metadata()
-        
-        total_images = len(metadata)
-        total_size = sum(img.get('file_size', 0) for img in metadata.values())
+        with self._lock:
+            type_rows = self._db.execute(
+                "SELECT type, COUNT(*) FROM images GROUP BY type"
+            ).fetchall()
+            known_ids = {row[0] for row in self._db.execute("SELECT id FROM images")}
         
         type_counts = {}
-        for img in metadata.values():
-            img_type = img.get('type', 'unknown')
-            type_counts[img_type] = type_counts.get(img_type, 0) + 1
+        for img_type, count in type_rows:
+            img_type = img_type or 'unknown'
+            type_counts[img_type] = type_counts.get(img_type, 0) + count
+        total_images = sum(type_counts.values())
+        
+        # Measure what is actually on disk in one directory pass; files without
+        # a metadata row are left over from interrupted stores or deletes
+        total_size = 0
+        orphan_files = 0
+        with os.scandir(self.images_dir) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                total_size += entry.stat().st_size
+                if os.path.splitext(entry.name)[0] not in known_ids:
+                    orphan_files += 1
         
         return {
             'total_images': total_images,
             'total_size_bytes': total_size,
             'total_size_mb': round(total_size / (1024 * 1024), 2),
+            'orphan_files': orphan_files,
             'type_counts': type_counts,
             'storage_path': str(self.storage_dir)
         }
@@ -1,21 +1,37 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from fastapi import FastAPI, File, UploadFile, Form, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response
 import rembg
-from PIL import Image
-import io
-import numpy as np
-import cv2
-from typing import Optional
+from PIL import Image, ImageFilter
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
 import logging
 from image_processor import HighResImageProcessor
 from format_optimizer import ImageFormatOptimizer
 from image_classifier import ImageClassifier
+from image_decoder import decode_image
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# ONNX Runtime providers for rembg; CUDA is used when enabled and present in the installed build
+def _onnx_providers() -> list:
+    try:
+        import onnxruntime as ort
+        available = ort.get_available_providers()
+    except Exception:
+        available = []
+    
+    if os.getenv('REMBG_USE_CUDA', '1') == '1' and 'CUDAExecutionProvider' in available:
+        logger.info("Running rembg inference with CUDAExecutionProvider")
+        return ['CUDAExecutionProvider', 'CPUExecutionProvider']
+    return ['CPUExecutionProvider']
+
+ONNX_PROVIDERS = _onnx_providers()
+
 app = FastAPI(title="BG Remover API", version="1.0.0")
 
 # Configure CORS
@@ -35,26 +51,39 @@ AVAILABLE_MODELS = {
     "isnet-general-use": "isnet-general-use"
 }
 
+# rembg sessions by model name; loading an ONNX model takes far longer than inference
+_SESSIONS: Dict[str, Any] = {}
+_SESSIONS_LOCK = threading.Lock()
+
+def get_session(model_name: str):
+    """
+    Return the shared rembg session for a model, creating it on first use
+    """
+    session = _SESSIONS.get(model_name)
+    if session is None:
+        with _SESSIONS_LOCK:
+            session = _SESSIONS.get(model_name)
+            if session is None:
+                session = rembg.new_session(model_name, providers=ONNX_PROVIDERS)
+                _SESSIONS[model_name] = session
+    return session
+
 # Initialize processors
 image_processor = HighResImageProcessor()
 format_optimizer = ImageFormatOptimizer()
 image_classifier = ImageClassifier()
 
+@app.on_event("shutdown")
+def shutdown_workers():
+    """Stop the batch encode threads with the server"""
+    format_optimizer.close()
+
 def enhance_image_quality(image: Image.Image) -> Image.Image:
     """
     Enhance image quality for better background removal results
     """
-    # Convert to numpy array
-    img_array = np.array(image)
-    
-    # Apply slight sharpening
-    kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
-    sharpened = cv2.filter2D(img_array, -1, kernel)
-    
-    # Ensure we don't exceed valid pixel values
-    sharpened = np.clip(sharpened, 0, 255)
-    
-    return Image.fromarray(sharpened.astype(np.uint8))
+    # Apply slight sharpening; Pillow's separable C filter avoids the numpy round trip
+    return image.filter(ImageFilter.UnsharpMask(radius=1, percent=150, threshold=3))
 
 def post_process_result(result_image: Image.Image, original_image: Image.Image) -> Image.Image:
     """
@@ -64,54 +93,55 @@ def post_process_result(result_image: Image.Image, original_image: Image.Image)
     if result_image.size != original_image.size:
         result_image = result_image.resize(original_image.size, Image.Resampling.LANCZOS)
     
-    # Apply edge smoothing to reduce artifacts
-    result_array = np.array(result_image)
+    if result_image.mode != 'RGBA':
+        return result_image
     
-    if len(result_array.shape) == 4:  # RGBA
-        # Smooth the alpha channel edges
-        alpha = result_array[:, :, 3]
-        alpha_smoothed = cv2.GaussianBlur(alpha, (3, 3), 0.5)
-        result_array[:, :, 3] = alpha_smoothed
+    # Apply edge smoothing to reduce artifacts; only the alpha band is touched
+    r, g, b, alpha = result_image.split()
+    alpha = alpha.filter(ImageFilter.GaussianBlur(radius=0.5))
     
-    return Image.fromarray(result_array)
+    return Image.merge('RGBA', (r, g, b, alpha))
 
 @app.get("/")
 async def root():
     return {"message": "BG Remover API is running"}
 
+# /models is static, so it is serialized once instead of on every request
+_MODELS_BYTES = json.dumps({
+    "models": [
+        {
+            "id": "auto",
+            "name": "Auto Select",
+            "description": "Automatically choose the best model for your image",
+            "recommended": True
+        },
+        {
+            "id": "u2net",
+            "name": "U²-Net",
+            "description": "General purpose - Best for most images"
+        },
+        {
+            "id": "u2net_human_seg",
+            "name": "U²-Net Human",
+            "description": "Optimized for people and portraits"
+        },
+        {
+            "id": "silueta",
+            "name": "Silueta",
+            "description": "High accuracy for complex shapes"
+        },
+        {
+            "id": "isnet-general-use",
+            "name": "ISNet General",
+            "description": "Latest model with improved quality"
+        }
+    ]
+}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
 @app.get("/models")
 async def get_available_models():
     """Get list of available background removal models"""
-    return {
-        "models": [
-            {
-                "id": "auto",
-                "name": "Auto Select",
-                "description": "Automatically choose the best model for your image",
-                "recommended": True
-            },
-            {
-                "id": "u2net",
-                "name": "U²-Net",
-                "description": "General purpose - Best for most images"
-            },
-            {
-                "id": "u2net_human_seg",
-                "name": "U²-Net Human",
-                "description": "Optimized for people and portraits"
-            },
-            {
-                "id": "silueta",
-                "name": "Silueta",
-                "description": "High accuracy for complex shapes"
-            },
-            {
-                "id": "isnet-general-use",
-                "name": "ISNet General",
-                "description": "Latest model with improved quality"
-            }
-        ]
-    }
+    return Response(content=_MODELS_BYTES, media_type="application/json")
 
 @app.post("/analyze-image")
 async def analyze_image(image: UploadFile = File(...)):
@@ -121,9 +151,8 @@ async def analyze_image(image: UploadFile = File(...)):
         if not image.content_type or not image.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
 
-        # Read and analyze the image
-        image_data = await image.read()
-        pil_image = Image.open(io.BytesIO(image_data))
+        # Decode straight from the spooled upload instead of copying it into memory
+        pil_image = decode_image(image.file)
 
         # Get classification and recommendations
         classification = image_classifier.classify_image(pil_image)
@@ -144,7 +173,8 @@ async def remove_background(
     image: UploadFile = File(...),
     model: str = Form(default="auto"),
     output_format: str = Form(default="auto"),
-    quality: str = Form(default="high")
+    quality: str = Form(default="high"),
+    accept: Optional[str] = Header(default=None)
 ):
     """
     Remove background from uploaded image using specified model
@@ -154,9 +184,11 @@ async def remove_background(
         if not image.content_type or not image.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
 
-        # Read and process the image
-        image_data = await image.read()
-        original_image = Image.open(io.BytesIO(image_data))
+        # Decode straight from the spooled upload instead of copying it into memory
+        original_image = decode_image(image.file)
+
+        # Source format for output selection; TurboJPEG-decoded images carry no format, so fall back to the extension
+        original_format = original_image.format or os.path.splitext(image.filename or '')[1].lstrip('.')
 
         # Determine optimal model if auto is selected
         if model == "auto":
@@ -174,24 +206,23 @@ async def remove_background(
         # Preprocess image for high quality results
         processed_image = image_processor.preprocess_image(original_image)
         
-        # Create rembg session with selected model
-        session = rembg.new_session(AVAILABLE_MODELS[selected_model])
+        # Get the cached rembg session for the selected model
+        session = get_session(AVAILABLE_MODELS[selected_model])
         
-        # Convert processed image back to bytes for rembg
-        img_byte_arr = io.BytesIO()
-        processed_image.save(img_byte_arr, format='PNG')
-        img_byte_arr = img_byte_arr.getvalue()
-
-        # Remove background
-        result_bytes = rembg.remove(img_byte_arr, session=session)
+        # Remove background; rembg takes and returns PIL images directly
+        result_image = rembg.remove(processed_image, session=session)
 
-        # Load result and post-process with high-quality pipeline
-        result_image = Image.open(io.BytesIO(result_bytes))
+        # Post-process with high-quality pipeline
         result_image = image_processor.postprocess_result(result_image, original_image)
 
         # Determine optimal output format
         if output_format == "auto":
-            optimal_format = format_optimizer.get_optimal_format(result_image, image.filename)
+            accept_webp = 'image/webp' in (accept or '')
+            optimal_format = format_optimizer.get_optimal_format(
+                result_image,
+                original_format,
+                accept_webp=accept_webp
+            )
         else:
             optimal_format = output_format.upper()
 
@@ -212,8 +243,9 @@ async def remove_background(
         
         logger.info("Background removal completed successfully")
         
-        return StreamingResponse(
-            io.BytesIO(optimized_bytes),
+        # The encoded bytes are already in memory; send them as-is
+        return Response(
+            content=optimized_bytes,
             media_type=content_type,
             headers={"Content-Disposition": f"attachment; filename=result.{final_format.lower()}"}
         )
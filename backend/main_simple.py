@@ -1,18 +1,82 @@
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, Response
-from PIL import Image, ImageFilter, ImageEnhance
-import io
+from fastapi.responses import Response, StreamingResponse
+import aiofiles
+import asyncio
+import json
+import os
+import time
+import threading
 import numpy as np
 import cv2
-from typing import Optional, List
+from typing import Optional, List, Tuple
 import logging
 from image_storage import storage
+from array_pool import array_pool
+from mask_kernels import pack_rgba, invert_blur_mask
+from image_decoder import decode_image
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Let OpenCV split filters across this worker's share of the cores; WORKERS is set by start_simple.py
+WORKERS = max(1, int(os.getenv("WORKERS", "1")))
+cv2.setNumThreads(max(1, (os.cpu_count() or 1) // WORKERS))
+
+# OpenCV CUDA module for the mask clean-up; only present in CUDA-enabled builds
+try:
+    HAS_CV_CUDA = cv2.cuda.getCudaEnabledDeviceCount() > 0
+except (AttributeError, cv2.error):
+    HAS_CV_CUDA = False
+
+# GrabCut runs on a copy at most this many pixels on its long side
+GRABCUT_MAX_SIDE = 512
+
+# 256-entry cv2.LUT table, GrabCut label -> mask value: GC_FGD (1) and GC_PR_FGD (3) are foreground
+_GRABCUT_FOREGROUND = np.zeros(256, np.uint8)
+_GRABCUT_FOREGROUND[[cv2.GC_FGD, cv2.GC_PR_FGD]] = 255
+
+# 1-D Gaussian taps for the separable 3x3 mask blur
+_GAUSSIAN_3 = cv2.getGaussianKernel(3, 0)
+
+# Structuring elements for the mask clean-up; OpenCV runs rectangular ones as
+# separate row and column min/max passes instead of a generic 2-D scan
+_KERNEL_3 = np.ones((3, 3), np.uint8)
+_KERNEL_RECT_5 = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
+
+# Shared by every request, so make accidental in-place edits fail loudly
+for _constant in (_GRABCUT_FOREGROUND, _GAUSSIAN_3, _KERNEL_3, _KERNEL_RECT_5):
+    _constant.setflags(write=False)
+
+# Leading signature bytes of the accepted upload formats; the client's content type is not trusted
+_MAGIC = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+    (b'II*\x00', 'tiff'),
+    (b'MM\x00*', 'tiff'),
+)
+
+# Formats cv2.imdecode can't read; these go straight to PIL
+_PIL_ONLY_FORMATS = {'gif'}
+
+def _sniff(head: bytes) -> Optional[str]:
+    """
+    Identify an image format from its first 12 bytes, or None if unrecognized
+    """
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    for magic, kind in _MAGIC:
+        if head.startswith(magic):
+            return kind
+    return None
+
+# Per-thread GrabCut GMM buffers, reused by every request on that worker thread
+_grabcut_state = threading.local()
+
 app = FastAPI(title="BG Remover API (Simple)", version="1.0.0")
 
 # Configure CORS
@@ -24,127 +88,221 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-def simple_background_removal(image: Image.Image) -> Image.Image:
+def simple_background_mask(img_bgr: np.ndarray, out: np.ndarray):
     """
     Simple background removal using edge detection and color analysis
-    This is a fallback when rembg is not available
+    This is a fallback when rembg is not available; writes the alpha mask into out
     """
-    # Convert to numpy array
-    img_array = np.array(image.convert('RGB'))
-    
-    # Create a simple mask based on edge detection and color analysis
-    gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-    
-    # Apply GaussianBlur to reduce noise
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-    
-    # Use adaptive threshold to create a mask
-    mask = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
-    
-    # Apply morphological operations to clean up the mask
-    kernel = np.ones((3, 3), np.uint8)
-    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
-    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
-    
-    # Invert mask (we want to keep the foreground)
-    mask = cv2.bitwise_not(mask)
-    
-    # Apply some smoothing to the mask edges
-    mask = cv2.GaussianBlur(mask, (3, 3), 0)
-    
-    # Create RGBA image
-    rgba_array = np.zeros((img_array.shape[0], img_array.shape[1], 4), dtype=np.uint8)
-    rgba_array[:, :, :3] = img_array
-    rgba_array[:, :, 3] = mask
-    
-    return Image.fromarray(rgba_array, 'RGBA')
+    # Ping-pong between out and a pooled scratch buffer; every step writes into one of them
+    with array_pool.borrow(img_bgr.shape[:2]) as buf:
+        # Create a simple mask based on edge detection and color analysis
+        cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY, dst=buf)
+        
+        # Apply GaussianBlur to reduce noise
+        cv2.GaussianBlur(buf, (5, 5), 0, dst=out)
+        
+        # Use adaptive threshold to create a mask
+        cv2.adaptiveThreshold(out, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2, dst=buf)
+        
+        # Apply morphological operations to clean up the mask
+        cv2.morphologyEx(buf, cv2.MORPH_CLOSE, _KERNEL_3, dst=out)
+        cv2.morphologyEx(out, cv2.MORPH_OPEN, _KERNEL_3, dst=buf)
+        
+        # Invert mask (we want to keep the foreground) and smooth its edges in one pass
+        invert_blur_mask(buf, out)
 
-def enhanced_background_removal(image: Image.Image) -> Image.Image:
+def _decode_bgr(image_data: bytes, image_kind: Optional[str] = None) -> np.ndarray:
     """
-    Enhanced background removal using multiple techniques
+    Decode upload bytes straight to a BGR array, using PIL for formats OpenCV can't read
     """
-    # Convert to numpy array
-    img_array = np.array(image.convert('RGB'))
-    height, width = img_array.shape[:2]
-    
-    # Method 1: Color-based segmentation
-    # Convert to HSV for better color segmentation
-    hsv = cv2.cvtColor(img_array, cv2.COLOR_RGB2HSV)
+    img_bgr = None
+    if image_kind not in _PIL_ONLY_FORMATS:
+        img_bgr = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+    if img_bgr is None:
+        # e.g. GIF, which OpenCV has no decoder for
+        rgb = np.asarray(decode_image(image_data).convert('RGB'))
+        img_bgr = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+    return img_bgr
+
+def _composite_on_white(img_bgr: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """
+    Blend an image over a white background using mask as alpha, without building RGBA
+    """
+    alpha = cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR)
     
-    # Create mask for likely background colors (adjust these ranges as needed)
-    # This assumes background is often white, light colors, or uniform
-    lower_white = np.array([0, 0, 200])
-    upper_white = np.array([180, 30, 255])
-    white_mask = cv2.inRange(hsv, lower_white, upper_white)
+    # white + (color - white) * alpha / 255, kept in uint8 as 255 - (255 - color) * alpha / 255
+    bgr = cv2.bitwise_not(img_bgr)
+    cv2.multiply(bgr, alpha, dst=bgr, scale=1 / 255)
+    cv2.bitwise_not(bgr, dst=bgr)
+    return bgr
+
+def _clean_mask_gpu(mask: np.ndarray, kernel: np.ndarray, out: np.ndarray):
+    """
+    Close, open and blur a binary mask on the GPU, downloading the result into out
+    """
+    close_filter = cv2.cuda.createMorphologyFilter(cv2.MORPH_CLOSE, cv2.CV_8UC1, kernel)
+    open_filter = cv2.cuda.createMorphologyFilter(cv2.MORPH_OPEN, cv2.CV_8UC1, kernel)
+    blur_filter = cv2.cuda.createGaussianFilter(cv2.CV_8UC1, cv2.CV_8UC1, (3, 3), 0)
     
-    # Method 2: Edge-based segmentation
-    gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-    edges = cv2.Canny(gray, 50, 150)
+    # Upload once, chain the filters on the device, download once
+    gpu_mask = cv2.cuda_GpuMat()
+    gpu_mask.upload(mask)
+    gpu_mask = close_filter.apply(gpu_mask)
+    gpu_mask = open_filter.apply(gpu_mask)
+    gpu_mask = blur_filter.apply(gpu_mask)
+    gpu_mask.download(out)
+
+def _grabcut_models() -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Zeroed background/foreground GMM arrays for GrabCut, reused per thread
+    """
+    bgd_model = getattr(_grabcut_state, 'bgd_model', None)
+    if bgd_model is None:
+        bgd_model = _grabcut_state.bgd_model = np.zeros((1, 65), np.float64)
+        fgd_model = _grabcut_state.fgd_model = np.zeros((1, 65), np.float64)
+    else:
+        fgd_model = _grabcut_state.fgd_model
+        bgd_model.fill(0)
+        fgd_model.fill(0)
+    return bgd_model, fgd_model
+
+def enhanced_background_mask(img_bgr: np.ndarray, out: np.ndarray):
+    """
+    Enhanced background removal using multiple techniques; writes the alpha mask into out
+    """
+    height, width = img_bgr.shape[:2]
     
-    # Dilate edges to create thicker boundaries
-    kernel = np.ones((3, 3), np.uint8)
-    edges = cv2.dilate(edges, kernel, iterations=1)
+    # GrabCut algorithm for segmentation; its cost grows with pixel count, so it
+    # runs on a downscaled copy and only the resulting mask is upscaled
+    scale = min(1.0, GRABCUT_MAX_SIDE / max(height, width))
+    if scale < 1.0:
+        small = cv2.resize(img_bgr, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    else:
+        small = img_bgr
+    small_height, small_width = small.shape[:2]
     
-    # Method 3: GrabCut algorithm for better segmentation
-    mask = np.zeros(gray.shape[:2], np.uint8)
-    bgd_model = np.zeros((1, 65), np.float64)
-    fgd_model = np.zeros((1, 65), np.float64)
+    bgd_model, fgd_model = _grabcut_models()
     
     # Define rectangle around the likely foreground (center area)
-    rect = (width//8, height//8, width*3//4, height*3//4)
-    
-    try:
-        cv2.grabCut(img_array, mask, rect, bgd_model, fgd_model, 5, cv2.GC_INIT_WITH_RECT)
-        mask2 = np.where((mask == 2) | (mask == 0), 0, 1).astype('uint8')
-    except:
-        # Fallback to simple thresholding if GrabCut fails
-        _, mask2 = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    
-    # Combine methods
-    final_mask = mask2 * 255
+    rect = (small_width//8, small_height//8, small_width*3//4, small_height*3//4)
     
-    # Apply morphological operations to clean up
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-    final_mask = cv2.morphologyEx(final_mask, cv2.MORPH_CLOSE, kernel)
-    final_mask = cv2.morphologyEx(final_mask, cv2.MORPH_OPEN, kernel)
-    
-    # Smooth the mask edges
-    final_mask = cv2.GaussianBlur(final_mask, (3, 3), 0)
-    
-    # Create RGBA image
-    rgba_array = np.zeros((height, width, 4), dtype=np.uint8)
-    rgba_array[:, :, :3] = img_array
-    rgba_array[:, :, 3] = final_mask
-    
-    return Image.fromarray(rgba_array, 'RGBA')
+    # Ping-pong between a pooled mask and out; GrabCut initializes the mask from rect
+    with array_pool.borrow(img_bgr.shape[:2]) as mask:
+        small_mask = mask if small is img_bgr else np.empty((small_height, small_width), np.uint8)
+        try:
+            cv2.grabCut(small, small_mask, rect, bgd_model, fgd_model, 5, cv2.GC_INIT_WITH_RECT)
+            # Map labels straight to 0/255 in place; LUT indexes with the uint8 labels directly
+            cv2.LUT(small_mask, _GRABCUT_FOREGROUND, dst=small_mask)
+        except:
+            # Fallback to simple thresholding if GrabCut fails
+            gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+            cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=small_mask)
+        
+        if small_mask is not mask:
+            cv2.resize(small_mask, (width, height), dst=mask, interpolation=cv2.INTER_LINEAR)
+            cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY, dst=mask)
+        
+        # Apply morphological operations to clean up, then smooth the mask edges
+        if HAS_CV_CUDA:
+            _clean_mask_gpu(mask, _KERNEL_RECT_5, out)
+        else:
+            cv2.morphologyEx(mask, cv2.MORPH_CLOSE, _KERNEL_RECT_5, dst=out, borderType=cv2.BORDER_REPLICATE)
+            cv2.morphologyEx(out, cv2.MORPH_OPEN, _KERNEL_RECT_5, dst=mask, borderType=cv2.BORDER_REPLICATE)
+            cv2.sepFilter2D(mask, -1, _GAUSSIAN_3, _GAUSSIAN_3, dst=out)
+
+def _compute_mask(img_bgr: np.ndarray, model: str, out: np.ndarray):
+    """
+    Write the foreground alpha mask for the selected model into out
+    """
+    if model == "simple":
+        simple_background_mask(img_bgr, out)
+    else:  # enhanced or auto
+        enhanced_background_mask(img_bgr, out)
+
+def _process_sync(image_data: bytes, image_kind: str, filename: Optional[str], model: str,
+                  output_format: str, quality: str) -> Tuple[bytes, str, str, str, str]:
+    """
+    Blocking part of /remove-background, run in a worker thread
+
+    Returns the encoded result, its content type and extension, and the
+    stored original and processed image IDs
+    """
+    img_bgr = _decode_bgr(image_data, image_kind)
+
+    # Store original image
+    original_id = storage.store_image(
+        image_data,
+        filename or "uploaded_image.png",
+        "original",
+        metadata={"model_used": model, "upload_time": "now"}
+    )
+
+    with array_pool.borrow(img_bgr.shape[:2]) as mask:
+        # Apply background removal based on selected model
+        _compute_mask(img_bgr, model, mask)
+
+        # Encode result with OpenCV straight from the arrays
+        if output_format.upper() in ["JPG", "JPEG"]:
+            # JPEG has no alpha; blend over white directly instead of building BGRA
+            success, encoded = cv2.imencode(
+                '.jpg',
+                _composite_on_white(img_bgr, mask),
+                [cv2.IMWRITE_JPEG_QUALITY, 95, cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+            )
+            content_type = "image/jpeg"
+            file_ext = "jpg"
+        else:
+            # PNG, also the default
+            success, encoded = cv2.imencode('.png', pack_rgba(img_bgr, mask), [cv2.IMWRITE_PNG_COMPRESSION, 3])
+            content_type = "image/png"
+            file_ext = "png"
+
+    if not success:
+        raise ValueError(f"Could not encode result as {file_ext.upper()}")
+    # Materialize bytes once and share them between storage and the HTTP response;
+    # io.BytesIO shares a bytes object for the thumbnail but would copy a memoryview
+    processed_data = encoded.tobytes()
+    processed_filename = f"processed_{filename or 'image'}.{file_ext}"
+    processed_id = storage.store_image(
+        processed_data,
+        processed_filename,
+        "processed",
+        parent_id=original_id,
+        metadata={"model_used": model, "output_format": output_format, "quality": quality}
+    )
+
+    return processed_data, content_type, file_ext, original_id, processed_id
 
 @app.get("/")
 async def root():
     return {"message": "BG Remover API (Simple) is running"}
 
+# /models is static, so it is serialized once instead of on every request
+_MODELS_BYTES = json.dumps({
+    "models": [
+        {
+            "id": "auto",
+            "name": "Auto Select",
+            "description": "Automatically choose the best model for your image",
+            "recommended": True
+        },
+        {
+            "id": "enhanced",
+            "name": "Enhanced Segmentation",
+            "description": "Advanced background removal using multiple techniques"
+        },
+        {
+            "id": "simple",
+            "name": "Simple Edge Detection",
+            "description": "Basic background removal using edge detection"
+        }
+    ]
+}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
 @app.get("/models")
 async def get_available_models():
     """Get list of available background removal models"""
-    return {
-        "models": [
-            {
-                "id": "auto",
-                "name": "Auto Select",
-                "description": "Automatically choose the best model for your image",
-                "recommended": True
-            },
-            {
-                "id": "enhanced",
-                "name": "Enhanced Segmentation",
-                "description": "Advanced background removal using multiple techniques"
-            },
-            {
-                "id": "simple",
-                "name": "Simple Edge Detection",
-                "description": "Basic background removal using edge detection"
-            }
-        ]
-    }
+    return Response(content=_MODELS_BYTES, media_type="application/json")
 
 @app.post("/analyze-image")
 async def analyze_image(image: UploadFile = File(...)):
@@ -181,78 +339,28 @@ async def remove_background(
     Remove background from uploaded image using simple computer vision techniques
     """
     try:
-        # Validate file type
-        if not image.content_type or not image.content_type.startswith('image/'):
+        # Read the upload and validate its file type from the leading bytes
+        image_data = await image.read()
+        image_kind = _sniff(image_data[:12])
+        if image_kind is None:
             raise HTTPException(status_code=400, detail="File must be an image")
         
         # Handle auto model selection (default to enhanced)
         if model == "auto":
             model = "enhanced"
 
-        logger.info(f"Processing image with model: {model}")
+        logger.info(f"Processing {image_kind} image with model: {model}")
 
-        # Read and process the image
-        image_data = await image.read()
-        original_image = Image.open(io.BytesIO(image_data))
-
-        # Store original image
-        original_id = storage.store_image(
-            image_data,
-            image.filename or "uploaded_image.png",
-            "original",
-            metadata={"model_used": model, "upload_time": "now"}
-        )
-
-        # Convert to RGB if necessary
-        if original_image.mode != 'RGB':
-            original_image = original_image.convert('RGB')
-
-        # Apply background removal based on selected model
-        if model == "simple":
-            result_image = simple_background_removal(original_image)
-        else:  # enhanced or auto
-            result_image = enhanced_background_removal(original_image)
-
-        # Save result to bytes
-        output_buffer = io.BytesIO()
-
-        if output_format.upper() == "PNG":
-            result_image.save(output_buffer, format='PNG', optimize=True)
-            content_type = "image/png"
-            file_ext = "png"
-        elif output_format.upper() in ["JPG", "JPEG"]:
-            # For JPEG, we need to handle transparency
-            if result_image.mode == 'RGBA':
-                # Create white background
-                background = Image.new('RGB', result_image.size, (255, 255, 255))
-                background.paste(result_image, mask=result_image.split()[-1])
-                result_image = background
-            result_image.save(output_buffer, format='JPEG', optimize=True, quality=95)
-            content_type = "image/jpeg"
-            file_ext = "jpg"
-        else:
-            # Default to PNG
-            result_image.save(output_buffer, format='PNG', optimize=True)
-            content_type = "image/png"
-            file_ext = "png"
-
-        output_buffer.seek(0)
-        processed_data = output_buffer.getvalue()
-
-        # Store processed image
-        processed_filename = f"processed_{image.filename or 'image'}.{file_ext}"
-        processed_id = storage.store_image(
-            processed_data,
-            processed_filename,
-            "processed",
-            parent_id=original_id,
-            metadata={"model_used": model, "output_format": output_format, "quality": quality}
+        # Decode, segment, encode and store off the event loop
+        processed_data, content_type, file_ext, original_id, processed_id = await asyncio.to_thread(
+            _process_sync, image_data, image_kind, image.filename, model, output_format, quality
         )
 
         logger.info("Background removal completed successfully")
 
-        return StreamingResponse(
-            io.BytesIO(processed_data),
+        # The encoded bytes are already in memory; send them as-is
+        return Response(
+            content=processed_data,
             media_type=content_type,
             headers={
                 "Content-Disposition": f"attachment; filename=result.{file_ext}",
@@ -261,34 +369,90 @@ async def remove_background(
             }
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing image: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
 # Storage management endpoints
 
+@app.post("/upload-batch")
+async def upload_batch(images: List[UploadFile] = File(...)):
+    """Store several uploaded images in one batch"""
+    try:
+        items = []
+        for image in images:
+            # Validate file type from the leading bytes
+            image_data = await image.read()
+            if _sniff(image_data[:12]) is None:
+                raise HTTPException(status_code=400, detail=f"File must be an image: {image.filename}")
+            
+            items.append((
+                image_data,
+                image.filename or "uploaded_image.png",
+                "original",
+                None,
+                {"upload_time": "now"}
+            ))
+
+        image_ids = await asyncio.to_thread(storage.store_images_batch, items)
+
+        return {"image_ids": image_ids, "message": f"Stored {len(image_ids)} images"}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error storing image batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error storing image batch: {str(e)}")
+
 @app.get("/images")
 async def list_stored_images(
     image_type: Optional[str] = Query(None, description="Filter by image type (original, processed, edited)"),
-    parent_id: Optional[str] = Query(None, description="Filter by parent image ID")
+    parent_id: Optional[str] = Query(None, description="Filter by parent image ID"),
+    limit: Optional[int] = Query(None, ge=1, description="Maximum number of images to return"),
+    offset: int = Query(0, ge=0, description="Number of images to skip")
 ):
     """Get list of stored images"""
     try:
-        images = storage.list_images(image_type=image_type, parent_id=parent_id)
+        images = await asyncio.to_thread(
+            storage.list_images, image_type=image_type, parent_id=parent_id, limit=limit, offset=offset
+        )
         return {"images": images}
     except Exception as e:
         logger.error(f"Error listing images: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error listing images: {str(e)}")
 
+# Stored images are streamed in blocks of this size so large PNGs are never held whole in memory
+STREAM_CHUNK_SIZE = 64 * 1024
+
+async def _iter_file(f, chunk_size: int = STREAM_CHUNK_SIZE):
+    """
+    Yield an open aiofiles handle in chunk_size blocks, closing it when done
+    """
+    try:
+        while True:
+            chunk = await f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        await f.close()
+
 @app.get("/images/{image_id}")
 async def get_stored_image(image_id: str):
     """Get a stored image by ID"""
     try:
-        image_data = storage.get_image_data(image_id)
-        if not image_data:
+        image_info = await asyncio.to_thread(storage.get_image, image_id)
+        if not image_info:
             raise HTTPException(status_code=404, detail="Image not found")
 
-        image_info = storage.get_image(image_id)
+        # Open before responding so a missing file is still a 404
+        try:
+            f = await aiofiles.open(image_info['file_path'], 'rb')
+        except FileNotFoundError:
+            logger.error(f"Image file not found: {image_info['file_path']}")
+            raise HTTPException(status_code=404, detail="Image not found")
 
         # Determine content type from file extension
         file_path = image_info.get('file_path', '')
@@ -301,8 +465,8 @@ async def get_stored_image(image_id: str):
         else:
             content_type = "image/png"
 
-        return Response(
-            content=image_data,
+        return StreamingResponse(
+            _iter_file(f),
             media_type=content_type,
             headers={"Content-Disposition": f"inline; filename={image_info.get('filename', 'image')}"}
         )
@@ -316,7 +480,7 @@ async def get_stored_image(image_id: str):
 async def get_image_thumbnail(image_id: str):
     """Get thumbnail for a stored image"""
     try:
-        thumbnail_data = storage.get_thumbnail_data(image_id)
+        thumbnail_data = await asyncio.to_thread(storage.get_thumbnail_data, image_id)
         if not thumbnail_data:
             raise HTTPException(status_code=404, detail="Thumbnail not found")
 
@@ -365,7 +529,6 @@ async def save_edited_image(
         # Parse metadata if provided
         edit_metadata = {}
         if metadata:
-            import json
             try:
                 edit_metadata = json.loads(metadata)
             except json.JSONDecodeError:
@@ -373,7 +536,8 @@ async def save_edited_image(
 
         # Store edited image
         edited_filename = f"edited_{original_info.get('original_filename', 'image')}"
-        edited_id = storage.store_image(
+        edited_id = await asyncio.to_thread(
+            storage.store_image,
             edited_data,
             edited_filename,
             "edited",
@@ -396,7 +560,7 @@ async def delete_stored_image(
 ):
     """Delete a stored image"""
     try:
-        success = storage.delete_image(image_id, delete_children=delete_children)
+        success = await asyncio.to_thread(storage.delete_image, image_id, delete_children=delete_children)
         if not success:
             raise HTTPException(status_code=404, detail="Image not found")
 
@@ -407,12 +571,24 @@ async def delete_stored_image(
         logger.error(f"Error deleting image {image_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error deleting image: {str(e)}")
 
+# Stats walk the storage directories, so dashboards polling this are served
+# from a (monotonic timestamp, response) pair for up to STATS_TTL seconds
+STATS_TTL = 1.0
+_stats_cache = (float('-inf'), None)
+
 @app.get("/storage/stats")
 async def get_storage_stats():
     """Get storage statistics"""
+    global _stats_cache
     try:
-        stats = storage.get_storage_stats()
-        return {"stats": stats}
+        cached_at, cached = _stats_cache
+        now = time.monotonic()
+        if now - cached_at < STATS_TTL:
+            return cached
+
+        stats = await asyncio.to_thread(storage.get_storage_stats)
+        _stats_cache = (now, {"stats": stats})
+        return _stats_cache[1]
     except Exception as e:
         logger.error(f"Error getting storage stats: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error getting storage stats: {str(e)}")
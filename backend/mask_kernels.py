@@ -0,0 +1,110 @@
+"""
+Per-pixel kernels for the mask pipelines, compiled with Numba when available
+"""
+
+import numpy as np
+import cv2
+import logging
+from array_pool import array_pool
+
+logger = logging.getLogger(__name__)
+
+# Optional JIT; the NumPy fallbacks produce identical results
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+    logger.info("Numba not installed; using NumPy mask kernels")
+
+# Eager signatures compile at import and let cache=True reuse the machine code
+# from __pycache__ on later starts, so no request pays for JIT compilation
+_PACK_SIGNATURE = 'void(uint8[:, :, ::1], uint8[:, ::1], uint8[:, :, ::1])'
+_BLUR_SIGNATURE = 'void(uint8[:, ::1], uint16[:, ::1], uint8[:, ::1])'
+
+if HAS_NUMBA:
+    @njit(_PACK_SIGNATURE, parallel=True, fastmath=True, boundscheck=False, cache=True)
+    def _pack_rgba_kernel(color, mask, out):
+        # One pass writing all four channels, rows spread across cores
+        height, width = mask.shape
+        for y in prange(height):
+            for x in range(width):
+                out[y, x, 0] = color[y, x, 0]
+                out[y, x, 1] = color[y, x, 1]
+                out[y, x, 2] = color[y, x, 2]
+                out[y, x, 3] = mask[y, x]
+
+    @njit(inline='always')
+    def _reflect101(i, n):
+        # OpenCV's default BORDER_REFLECT_101: -1 -> 1, n -> n - 2
+        if n == 1:
+            return 0
+        if i < 0:
+            return -i
+        if i >= n:
+            return 2 * n - 2 - i
+        return i
+
+    @njit(_BLUR_SIGNATURE, parallel=True, fastmath=True, boundscheck=False, cache=True)
+    def _invert_blur_kernel(mask, tmp, out):
+        # 3x3 Gaussian ([1, 2, 1] / 4 per axis) of (255 - mask) as two separable
+        # passes with plain inner loops LLVM can vectorize; uint16 holds the
+        # 1020 row-sum and 4080 total maxima
+        height, width = mask.shape
+        left_edge = _reflect101(-1, width)
+        right_edge = _reflect101(width, width)
+
+        for y in prange(height):
+            row = mask[y]
+            acc = tmp[y]
+            acc[0] = (255 - row[left_edge]) + 2 * (255 - row[0]) + (255 - row[min(1, width - 1)])
+            for x in range(1, width - 1):
+                acc[x] = (255 - row[x - 1]) + 2 * (255 - row[x]) + (255 - row[x + 1])
+            if width > 1:
+                acc[width - 1] = (255 - row[width - 2]) + 2 * (255 - row[width - 1]) + (255 - row[right_edge])
+
+        for y in prange(height):
+            above = tmp[_reflect101(y - 1, height)]
+            middle = tmp[y]
+            below = tmp[_reflect101(y + 1, height)]
+            dst = out[y]
+            for x in range(width):
+                dst[x] = (above[x] + 2 * middle[x] + below[x] + 8) >> 4
+
+def pack_rgba(color: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """
+    Interleave a 3-channel image and a single-channel mask into a new 4-channel array
+
+    Channel order is preserved, so BGR input gives BGRA output.
+    """
+    height, width = mask.shape
+    out = np.empty((height, width, 4), dtype=np.uint8)
+
+    if HAS_NUMBA:
+        _pack_rgba_kernel(np.ascontiguousarray(color), np.ascontiguousarray(mask), out)
+    else:
+        out[:, :, :3] = color
+        out[:, :, 3] = mask
+
+    return out
+
+def invert_blur_mask(mask: np.ndarray, out: np.ndarray):
+    """
+    Write the inverted mask, smoothed with a 3x3 Gaussian, into out
+    """
+    if HAS_NUMBA:
+        with array_pool.borrow(mask.shape, np.uint16) as tmp:
+            _invert_blur_kernel(np.ascontiguousarray(mask), tmp, out)
+    else:
+        cv2.GaussianBlur(cv2.bitwise_not(mask), (3, 3), 0, dst=out)
+
+def warmup():
+    """
+    Run every kernel once on a tiny image so the threading layer is up before the first request
+    """
+    color = np.zeros((16, 16, 3), dtype=np.uint8)
+    mask = np.zeros((16, 16), dtype=np.uint8)
+    pack_rgba(color, mask)
+    invert_blur_mask(mask, np.empty_like(mask))
+
+warmup()
@@ -17,6 +17,9 @@ if __name__ == "__main__":
     print("🔄 Auto-reload enabled for development")
     print("-" * 50)
     
+    # Let Pillow keep freed image blocks for reuse (inherited by the reload worker)
+    os.environ.setdefault("PILLOW_BLOCKS_MAX", "16")
+    
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
@@ -11,17 +11,32 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 if __name__ == "__main__":
+    # RELOAD=1 for development; otherwise run one worker process per core
+    reload = os.getenv("RELOAD", "0") == "1"
+    workers = 1 if reload else int(os.getenv("WORKERS", os.cpu_count() or 1))
+    
     print("🚀 Starting Simple BG Remover API server...")
     print("📍 Server will be available at: http://localhost:8000")
     print("📖 API documentation at: http://localhost:8000/docs")
-    print("🔄 Auto-reload enabled for development")
+    if reload:
+        print("🔄 Auto-reload enabled for development")
+    else:
+        print(f"👷 Running {workers} worker processes")
     print("⚠️  Using simple background removal (no AI models)")
     print("-" * 50)
     
+    # Let Pillow keep freed image blocks for reuse (inherited by the worker processes)
+    os.environ.setdefault("PILLOW_BLOCKS_MAX", "16")
+    
+    # Split the cores between workers so OpenCV and Numba pools don't oversubscribe the machine
+    os.environ["WORKERS"] = str(workers)
+    os.environ.setdefault("NUMBA_NUM_THREADS", str(max(1, (os.cpu_count() or 1) // workers)))
+    
     uvicorn.run(
         "main_simple:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
+        reload=reload,
+        workers=workers,
         log_level="info"
     )
@@ -52,7 +52,7 @@ def test_storage_system():
                 print(f"✅ Storage directory exists: {storage_path}")
                 print(f"   Images folder: {storage_path / 'images'}")
                 print(f"   Thumbnails folder: {storage_path / 'thumbnails'}")
-                print(f"   Metadata file: {storage_path / 'metadata.json'}")
+                print(f"   Metadata database: {storage_path / 'metadata.db'}")
             else:
                 print(f"⚠️  Storage directory not found: {storage_path}")
         else:
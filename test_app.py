@@ -1,198 +1,391 @@
 #!/usr/bin/env python3
 """
 Test script for the BG Remover application
+
+Run without arguments for the smoke tests, or with --bench to measure
+/remove-background throughput under concurrent load.
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import argparse
+import base64
 import os
+import statistics
+import sys
 import time
-from PIL import Image
-import io
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+# Optional faster JSON parsing; the stdlib parser accepts the same bytes
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+# One keep-alive session for every call, so each test reuses pooled connections
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=Retry(total=0, connect=0)))
+SESSION.headers.update({"Accept-Encoding": "gzip"})
+
+# (connect, read) timeouts: everything is on localhost, so a dead server fails in
+# CONNECT_TIMEOUT while slow endpoints still get their full read time
+CONNECT_TIMEOUT = 0.5
+DEFAULT_TIMEOUT = (CONNECT_TIMEOUT, 10)
+ANALYSIS_TIMEOUT = (CONNECT_TIMEOUT, 15)
+REMOVAL_TIMEOUT = (CONNECT_TIMEOUT, 30)
+
+# Models exercised by the background removal test; results are saved as test_result_{model}.png
+MODELS_TO_TEST = ['auto', 'u2net', 'silueta']
+
+# Result files written by this run, so cleanup never touches files it didn't create
+RESULT_FILES = []
 
-def test_api_health():
+def _probe(url, timeout=DEFAULT_TIMEOUT):
+    """Fetch a URL's status without downloading its body"""
+    response = SESSION.head(url, allow_redirects=True, timeout=timeout)
+    if response.status_code in (405, 501):
+        # Routes registered for GET only (e.g. FastAPI's /): close before reading the body
+        response = SESSION.get(url, stream=True, timeout=timeout)
+        response.close()
+    return response
+
+def test_api_health(log):
     """Test if the API is running"""
     try:
-        response = requests.get("http://localhost:8000/")
+        response = _probe("http://localhost:8000/")
         if response.status_code == 200:
-            print("✅ API is running")
+            log.append("✅ API is running")
             return True
         else:
-            print(f"❌ API returned status code: {response.status_code}")
+            log.append(f"❌ API returned status code: {response.status_code}")
             return False
     except requests.exceptions.ConnectionError:
-        print("❌ Cannot connect to API. Make sure the backend is running on port 8000")
+        log.append("❌ Cannot connect to API. Make sure the backend is running on port 8000")
         return False
 
-def test_models_endpoint():
+def test_models_endpoint(log):
     """Test the models endpoint"""
     try:
-        response = requests.get("http://localhost:8000/models")
+        response = SESSION.get("http://localhost:8000/models", timeout=DEFAULT_TIMEOUT)
         if response.status_code == 200:
-            models = response.json()
-            print(f"✅ Models endpoint working. Found {len(models['models'])} models")
+            models = json_loads(response.content)
+            log.append(f"✅ Models endpoint working. Found {len(models['models'])} models")
             for model in models['models']:
-                print(f"   - {model['name']}: {model['description']}")
+                log.append(f"   - {model['name']}: {model['description']}")
             return True
         else:
-            print(f"❌ Models endpoint failed with status: {response.status_code}")
+            log.append(f"❌ Models endpoint failed with status: {response.status_code}")
             return False
     except Exception as e:
-        print(f"❌ Error testing models endpoint: {e}")
+        log.append(f"❌ Error testing models endpoint: {e}")
         return False
 
+# 400x300 PNG: white background with a blue rectangle at (100, 75)-(300, 225) and a 2px black outline
+_TEST_IMAGE_B64 = (
+    "iVBORw0KGgoAAAANSUhEUgAAAZAAAAEsCAIAAABi1XKVAAAEqklEQVR42u3UwQkAAAgDse6/"
+    "tC5RH0KOTiCYjCQ9KU4gCViSBCxJwJIkYEkSsCQBS5KAJUnAkgQsSQKWJAFLErAkCViSBCxJ"
+    "wJIkYEkSsCQBS5KAJUnAkgQsSQKWJAFLErAkCViSBCxJwJIkYEkCliQBS5KAJQlYkgQsSQKW"
+    "JGBJErAkCViSgCVJwJIkYEkCliQBS5KAJQlYkgQsSQKWJGBJErAkCViSgCVJwJIkYEkCliQB"
+    "S5KAJQlYkgQsScCSJGBJErAkAUuSgCVJwJIELEkCliQBSxKwJAlYkgQsScCSJGBJErAkAUuS"
+    "gPXiWNJNngtYwBKwgAWsjFlvwAIWsAxYwAIWsAxYwAKWAUvAApYBC1jAMgMWsIBlwBKwgGXA"
+    "AhawzIAFLGAZsAQsYBmwgAUsM2ABC1gGLAELWAYsYAHLDFjAApYBC1gClgELWMAyAxawgGXA"
+    "ApaAZcACFrDMgAUsYBmwgCVgGbCABSwzYAELWAYsYAlYBixgAcsMWMAClgELWAKWAQtYwDJg"
+    "AQtYwDJgAQtYwDJgAQtYBiwBC1gGLGABywxYwAKWAUvAApYBC1jAMgMWsIBlwBKwgGXAAhaw"
+    "zIAFLGAZsAQsYBmwgAUsM2ABC1gGLGAJWAYsYAHLDFjAApYBC1gClgELWMAyAxawgGXAApaA"
+    "ZcACFrDMgAUsYBmwgCVgGbCABSwzYAELWAYsYAlYBixgAcuABSxgAcuABSxgAcuABSxgGbAE"
+    "LGAZsIAFLDNgAQtYBiwBC1gGLGABywxYwAKWAUvAApYBC1jAMgMWsIBlwBKwgGXAAhawzIAF"
+    "LGAZsIAlYBmwgAUsM2ABC1gGLGAJWAYsYAHLDFjAApYBC1gClgELWMAyAxawgGXAApaAZcAC"
+    "FrDMgAUsYBmwgCVgGbCABSwDljcEFrAMWMAClh8zYAELWAYsAQtYBixgAcsMWMAClgFLwAKW"
+    "AQtYwDIDFrCAZcASsIBlwAIWsMyABSxgGbAELGAZsIAFLDNgAQtYBixgCVgGLGABywxYwAKW"
+    "AQtYApYBC1jAMgMWsIBlwAKWgGXAAhawzIAFLGAZsIAlYBmwgAUsM2ABC1gGLGAJWAYsYAHL"
+    "gOW5gAUsAxawgOXHDFjAApYBS8AClgELWMAyAxawgGXAErCAZcACFrDMgAUsYBmwBCxgGbCA"
+    "BSwzYAELWAYsAQtYBixgAcsMWMAClgELWAKWAQtYwDIDFrCAZcACloBlwAIWsMyABSxgGbCA"
+    "JWAZsIAFLDNgAQtYBixgCVgGLGABywxYwAKWAQtYApYBC1jAMmAJWMAyYAELWFI5zwUsYAlY"
+    "wJIkYEkSsCQBS5KAJUnAkgQsSQKWJAFLErAkCViSBCxJwJIkYEkCliQBS5KAJQlYkgQsSQKW"
+    "JGBJErAkCViSgCVJwJIkYEkCliQBS5KAJQlYkgQsSQKWJGBJErAkCViSgCVJwJIkYEkCliQB"
+    "S5KAJQlYkgQsScCSJGBJErAkAUuSgCVJwJIELEkCliQBSxKwJAlYkgQsScCSJGBJErAkAUuS"
+    "gCVJwJIELEkCliQBSxKwJAlYkgQsScCSJGBJErAkAUuSgCUJWJIELElqtUpCajgFk3qpAAAA"
+    "AElFTkSuQmCC"
+)
+
+@lru_cache(maxsize=1)
 def create_test_image():
-    """Create a simple test image"""
-    # Create a simple test image with a colored rectangle on white background
-    img = Image.new('RGB', (400, 300), color='white')
+    """Return the test image as PNG bytes; decoded once and shared by every test"""
+    return base64.b64decode(_TEST_IMAGE_B64)
+
+# The endpoints take UploadFile form fields, so bodies stay multipart; a fixed
+# boundary lets each body be encoded once and resent as plain bytes
+MULTIPART_BOUNDARY = "----bgrtest"
+MULTIPART_HEADERS = {"Content-Type": f"multipart/form-data; boundary={MULTIPART_BOUNDARY}"}
+
+@lru_cache(maxsize=None)
+def _form_body(model=None):
+    """Encode the test image, plus model and quality fields when a model is given, as multipart/form-data"""
+    fields = {'model': model, 'quality': 'high'} if model else {}
     
-    # Add a colored rectangle in the center
-    from PIL import ImageDraw
-    draw = ImageDraw.Draw(img)
-    draw.rectangle([100, 75, 300, 225], fill='blue', outline='black', width=2)
+    parts = [
+        f'--{MULTIPART_BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in fields.items()
+    ]
+    parts.append(
+        f'--{MULTIPART_BOUNDARY}\r\nContent-Disposition: form-data; name="image"; filename="test.png"\r\n'
+        f'Content-Type: image/png\r\n\r\n'.encode()
+    )
+    parts.append(create_test_image())
+    parts.append(f'\r\n--{MULTIPART_BOUNDARY}--\r\n'.encode())
     
-    # Save to bytes
-    img_bytes = io.BytesIO()
-    img.save(img_bytes, format='PNG')
-    img_bytes.seek(0)
+    return b''.join(parts)
+
+def _post_one(model):
+    """
+    POST the test image for one model, streaming a successful result to test_result_{model}.png
+
+    Returns (model, elapsed, status, error text or None).
+    """
+    body = _form_body(model)
+    
+    start_time = time.perf_counter()
+    response = SESSION.post(
+        "http://localhost:8000/remove-background",
+        data=body,
+        headers=MULTIPART_HEADERS,
+        timeout=REMOVAL_TIMEOUT,
+        stream=True
+    )
+    try:
+        if response.status_code != 200:
+            return model, time.perf_counter() - start_time, response.status_code, response.text
+        
+        # Save result for manual inspection, one chunk at a time
+        path = f'test_result_{model}.png'
+        RESULT_FILES.append(path)
+        with open(path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=65536):
+                f.write(chunk)
+        end_time = time.perf_counter()
+    finally:
+        response.close()
     
-    return img_bytes.getvalue()
+    return model, end_time - start_time, response.status_code, None
 
-def test_background_removal():
+def test_background_removal(log):
     """Test background removal functionality"""
     try:
-        # Create test image
-        test_image_data = create_test_image()
-        
-        # Test with different models
-        models_to_test = ['auto', 'u2net', 'silueta']
+        # Test with different models; the requests are independent, so send them concurrently
+        with ThreadPoolExecutor(max_workers=len(MODELS_TO_TEST)) as executor:
+            results = list(executor.map(_post_one, MODELS_TO_TEST))
         
-        for model in models_to_test:
-            print(f"Testing background removal with model: {model}")
-            
-            files = {'image': ('test.png', test_image_data, 'image/png')}
-            data = {'model': model, 'quality': 'high'}
+        for model, elapsed, status_code, error in results:
+            log.append(f"Testing background removal with model: {model}")
             
-            start_time = time.time()
-            response = requests.post(
-                "http://localhost:8000/remove-background",
-                files=files,
-                data=data,
-                timeout=30
-            )
-            end_time = time.time()
-            
-            if response.status_code == 200:
-                print(f"   ✅ {model} model worked (took {end_time - start_time:.2f}s)")
-                
-                # Save result for manual inspection
-                with open(f'test_result_{model}.png', 'wb') as f:
-                    f.write(response.content)
-                print(f"   📁 Result saved as test_result_{model}.png")
+            if status_code == 200:
+                log.append(f"   ✅ {model} model worked (took {elapsed:.2f}s)")
+                log.append(f"   📁 Result saved as test_result_{model}.png")
             else:
-                print(f"   ❌ {model} model failed with status: {response.status_code}")
-                print(f"   Error: {response.text}")
+                log.append(f"   ❌ {model} model failed with status: {status_code}")
+                log.append(f"   Error: {error}")
         
         return True
         
     except Exception as e:
-        print(f"❌ Error testing background removal: {e}")
+        log.append(f"❌ Error testing background removal: {e}")
         return False
 
-def test_image_analysis():
+def test_image_analysis(log):
     """Test image analysis functionality"""
     try:
-        test_image_data = create_test_image()
-        
-        files = {'image': ('test.png', test_image_data, 'image/png')}
-        
-        response = requests.post(
+        response = SESSION.post(
             "http://localhost:8000/analyze-image",
-            files=files,
-            timeout=15
+            data=_form_body(),
+            headers=MULTIPART_HEADERS,
+            timeout=ANALYSIS_TIMEOUT
         )
         
         if response.status_code == 200:
-            analysis = response.json()
-            print("✅ Image analysis working")
-            print(f"   Detected type: {analysis['image_type']}")
-            print(f"   Recommended model: {analysis['recommended_model']}")
-            print(f"   Confidence: {analysis['confidence']:.2f}")
+            analysis = json_loads(response.content)
+            log.append("✅ Image analysis working")
+            log.append(f"   Detected type: {analysis['image_type']}")
+            log.append(f"   Recommended model: {analysis['recommended_model']}")
+            log.append(f"   Confidence: {analysis['confidence']:.2f}")
+            # Informational: shows whether the backend compresses JSON responses
+            log.append(f"   Response encoding: {response.headers.get('Content-Encoding', 'identity')}")
             return True
         else:
-            print(f"❌ Image analysis failed with status: {response.status_code}")
+            log.append(f"❌ Image analysis failed with status: {response.status_code}")
             return False
             
     except Exception as e:
-        print(f"❌ Error testing image analysis: {e}")
+        log.append(f"❌ Error testing image analysis: {e}")
         return False
 
-def test_frontend():
+def test_frontend(log):
     """Test if frontend is accessible"""
     try:
-        response = requests.get("http://localhost:3000", timeout=10)
+        response = _probe("http://localhost:3000")
         if response.status_code == 200:
-            print("✅ Frontend is accessible at http://localhost:3000")
+            log.append("✅ Frontend is accessible at http://localhost:3000")
             return True
         else:
-            print(f"❌ Frontend returned status code: {response.status_code}")
+            log.append(f"❌ Frontend returned status code: {response.status_code}")
             return False
     except requests.exceptions.ConnectionError:
-        print("❌ Cannot connect to frontend. Make sure it's running on port 3000")
+        log.append("❌ Cannot connect to frontend. Make sure it's running on port 3000")
         return False
     except Exception as e:
-        print(f"❌ Error testing frontend: {e}")
+        log.append(f"❌ Error testing frontend: {e}")
         return False
 
-def main():
+def _write_lines(lines):
+    """Write a block of report lines to stdout with one write call"""
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
+
+def _run_test(test_func):
+    """Run one test, collecting its output; returns (passed, lines)"""
+    log = []
+    return test_func(log), log
+
+def run_tests():
     """Run all tests"""
-    print("🧪 Testing BG Remover Application")
-    print("=" * 50)
+    _write_lines(["🧪 Testing BG Remover Application", "=" * 50])
     
+    # (name, test, needs the API to be up)
     tests = [
-        ("API Health Check", test_api_health),
-        ("Models Endpoint", test_models_endpoint),
-        ("Image Analysis", test_image_analysis),
-        ("Background Removal", test_background_removal),
-        ("Frontend Accessibility", test_frontend),
+        ("API Health Check", test_api_health, False),
+        ("Models Endpoint", test_models_endpoint, True),
+        ("Image Analysis", test_image_analysis, True),
+        ("Background Removal", test_background_removal, True),
+        ("Frontend Accessibility", test_frontend, False),
     ]
     
     passed = 0
+    skipped = 0
     total = len(tests)
     
-    for test_name, test_func in tests:
-        print(f"\n🔍 Running: {test_name}")
-        print("-" * 30)
+    # The tests are independent probes, so run them at once and report in order;
+    # API tests wait for the health check and are skipped rather than left to time out
+    with ThreadPoolExecutor(max_workers=total) as executor:
+        futures = {
+            test_name: executor.submit(_run_test, test_func)
+            for test_name, test_func, needs_api in tests if not needs_api
+        }
         
-        if test_func():
-            passed += 1
+        api_ok, _ = futures["API Health Check"].result()
+        if api_ok:
+            futures.update({
+                test_name: executor.submit(_run_test, test_func)
+                for test_name, test_func, needs_api in tests if needs_api
+            })
         
-        time.sleep(1)  # Brief pause between tests
+        # Each test's section is written in one go as soon as its result is in
+        for test_name, _, _ in tests:
+            section = [f"\n🔍 Running: {test_name}", "-" * 30]
+            
+            future = futures.get(test_name)
+            if future is None:
+                section.append("⏭️  Skipped: API is not running")
+                skipped += 1
+            else:
+                ok, log = future.result()
+                section.extend(log)
+                if ok:
+                    passed += 1
+            
+            _write_lines(section)
     
-    print("\n" + "=" * 50)
-    print(f"📊 Test Results: {passed}/{total} tests passed")
+    summary = [
+        "\n" + "=" * 50,
+        f"📊 Test Results: {passed}/{total} tests passed" + (f", {skipped} skipped" if skipped else ""),
+    ]
     
     if passed == total:
-        print("🎉 All tests passed! Your BG Remover app is working correctly.")
-        print("\n📝 Next steps:")
-        print("1. Open http://localhost:3000 in your browser")
-        print("2. Upload an image to test the full workflow")
-        print("3. Try different models and compare results")
+        summary += [
+            "🎉 All tests passed! Your BG Remover app is working correctly.",
+            "\n📝 Next steps:",
+            "1. Open http://localhost:3000 in your browser",
+            "2. Upload an image to test the full workflow",
+            "3. Try different models and compare results",
+        ]
     else:
-        print("⚠️  Some tests failed. Please check the error messages above.")
-        print("\n🔧 Troubleshooting:")
-        print("- Make sure both backend (port 8000) and frontend (port 3000) are running")
-        print("- Check that all Python dependencies are installed")
-        print("- Verify that Node.js dependencies are installed")
-    
-    # Cleanup test files
-    for model in ['auto', 'u2net', 'silueta']:
-        filename = f'test_result_{model}.png'
-        if os.path.exists(filename):
-            try:
-                os.remove(filename)
-                print(f"🧹 Cleaned up {filename}")
-            except:
-                pass
+        summary += [
+            "⚠️  Some tests failed. Please check the error messages above.",
+            "\n🔧 Troubleshooting:",
+            "- Make sure both backend (port 8000) and frontend (port 3000) are running",
+            "- Check that all Python dependencies are installed",
+            "- Verify that Node.js dependencies are installed",
+        ]
+    
+    # Cleanup the result files this run wrote
+    for path in RESULT_FILES:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            continue
+        summary.append(f"🧹 Cleaned up {path}")
+    
+    _write_lines(summary)
+
+def _timed_post(model):
+    """POST the test image for one model and read the whole response; returns (latency, status)"""
+    start = time.perf_counter()
+    response = SESSION.post(
+        "http://localhost:8000/remove-background",
+        data=_form_body(model),
+        headers=MULTIPART_HEADERS,
+        timeout=REMOVAL_TIMEOUT
+    )
+    response.content  # Read the body so the latency covers the full transfer
+    return time.perf_counter() - start, response.status_code
+
+def run_bench(model, n=20, concurrency=4):
+    """Send n background removal requests, concurrency at a time, and report RPS and latency percentiles"""
+    _write_lines([
+        "⏱️  Benchmarking BG Remover API",
+        "=" * 50,
+        f"Model: {model}, requests: {n}, concurrency: {concurrency}",
+    ])
+    
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            start = time.perf_counter()
+            results = list(executor.map(_timed_post, [model] * n))
+            wall_time = time.perf_counter() - start
+    except requests.exceptions.ConnectionError:
+        _write_lines(["❌ Cannot connect to API. Make sure the backend is running on port 8000"])
+        return False
+    
+    latencies = [latency for latency, status_code in results if status_code == 200]
+    report = [f"Throughput: {n / wall_time:.2f} req/s over {wall_time:.2f}s"]
+    
+    if len(latencies) >= 2:
+        percentiles = statistics.quantiles(latencies, n=100)
+        report.append(
+            f"Latency: p50 {percentiles[49]:.3f}s, p95 {percentiles[94]:.3f}s, p99 {percentiles[98]:.3f}s"
+        )
+    if len(latencies) < n:
+        report.append(f"❌ {n - len(latencies)} of {n} requests failed")
+    
+    _write_lines(report)
+    return len(latencies) == n
+
+def main():
+    """Run the smoke tests or the benchmark, then release the session's connections"""
+    parser = argparse.ArgumentParser(description="Test the BG Remover application")
+    parser.add_argument("--bench", action="store_true", help="benchmark /remove-background instead of running the smoke tests")
+    parser.add_argument("--model", default="auto", help="model to benchmark (default: auto)")
+    parser.add_argument("--requests", type=int, default=20, help="number of benchmark requests (default: 20)")
+    parser.add_argument("--concurrency", type=int, default=4, help="requests in flight at once (default: 4)")
+    args = parser.parse_args()
+    
+    try:
+        if args.bench:
+            run_bench(args.model, args.requests, args.concurrency)
+        else:
+            run_tests()
+    finally:
+        SESSION.close()
 
 if __name__ == "__main__":
     main()